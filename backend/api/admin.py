@@ -1 +1,16 @@
-# Register your models here.
+from django.contrib import admin
+
+from api.models import Job
+
+
+class JobAdm(admin.ModelAdmin):
+    model = Job
+    list_display = (
+        'id', 'name', 'status', 'attempts', 'user', 'run_at', 'finished_at'
+    )
+    list_display_links = ('name',)
+    list_filter = ['status', 'name']
+    readonly_fields = ('result', 'error')
+
+
+admin.site.register(Job, JobAdm)
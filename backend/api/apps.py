@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class RecipeApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import signals, tasks  # noqa: F401
+        from .instrumentation import install_recorder
+        connection_created.connect(install_recorder)
@@ -0,0 +1,14 @@
+from django.urls import path
+
+from .async_views import (AsyncIngredientListView, AsyncRecipeDetailView,
+                          AsyncRecipeListView, AsyncSubscriptionsView,
+                          AsyncTagListView)
+
+# Routes of api/urls.py served by async views, matched before it.
+urlpatterns = [
+    path('tags/', AsyncTagListView.as_view()),
+    path('users/subscriptions/', AsyncSubscriptionsView.as_view()),
+    path('recipes/', AsyncRecipeListView.as_view()),
+    path('recipes/<int:pk>/', AsyncRecipeDetailView.as_view()),
+    path('ingredients/', AsyncIngredientListView.as_view()),
+]
@@ -0,0 +1,256 @@
+import asyncio
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.paginator import InvalidPage, Page, Paginator
+from django.db import close_old_connections
+from django.views import View
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+
+from .db_router import primary
+from .memberships import request_memberships
+from .response_cache import (RECIPE, RECIPE_REFS, RECIPES, get_cached_response,
+                             response_key, store_response)
+from .views import (AllFollowingView, IngredientsViewSet, RecipesViewSet,
+                    TagViewSet)
+
+
+def database_sync_to_async(func):
+    # With ASYNC_CONCURRENT_QUERIES every call gets a worker thread and
+    # so its own connection, which lets the independent queries of one
+    # request run at the same time. Worker connections are recycled
+    # like the ones of sync requests.
+    def run(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(
+        run, thread_sensitive=not settings.ASYNC_CONCURRENT_QUERIES
+    )
+
+
+async def gather(*calls):
+    return await asyncio.gather(
+        *(database_sync_to_async(call)() for call in calls)
+    )
+
+
+def load_memberships(request, *kinds):
+    # Each kind on its own, so they load alongside the page.
+    memberships = request_memberships(request)
+    if memberships is None:
+        return ()
+    return [partial(memberships.__getitem__, kind) for kind in kinds]
+
+
+class AsyncReadView(View):
+    # Serves GET for a route of a DRF viewset as an async view. The
+    # viewset still authenticates, filters and serializes; subclasses
+    # only change how the queries are issued. Other methods, and GETs
+    # the subclass does not handle, go to the viewset itself.
+    viewset = None
+    actions = None
+    fallback = None
+    # Every route serves one of the read endpoints.
+    replica_reads = True
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(
+            fallback=sync_to_async(cls.viewset.as_view(cls.actions)),
+            **initkwargs
+        )
+        # Read by api/instrumentation.py, like on DRF views.
+        view.cls = cls
+        # Token authenticated, DRF views are exempt as well.
+        view.csrf_exempt = True
+        return view
+
+    def serves(self, request):
+        return True
+
+    async def dispatch(self, request, *args, **kwargs):
+        if request.method != 'GET' or not self.serves(request):
+            return await self.fallback(request, *args, **kwargs)
+        view = self.viewset()
+        view.action_map = self.actions
+        view.args = args
+        view.kwargs = kwargs
+        request = view.initialize_request(request, *args, **kwargs)
+        view.request = request
+        view.headers = view.default_response_headers
+        try:
+            await database_sync_to_async(view.initial)(request)
+            if request.accepted_renderer.format != 'json':
+                return await self.fallback(request._request, *args, **kwargs)
+            response = await self.get(view, request, *args, **kwargs)
+        except Exception as exc:
+            response = await database_sync_to_async(view.handle_exception)(
+                exc
+            )
+        return await sync_to_async(self.finalize)(view, request, response)
+
+    async def get(self, view, request, *args, **kwargs):
+        return await database_sync_to_async(getattr(view, view.action))(
+            request, *args, **kwargs
+        )
+
+    def finalize(self, view, request, response):
+        response = view.finalize_response(request, response)
+        if isinstance(response, Response):
+            response.render()
+        return response
+
+    async def paginate(self, view, request, queryset, load=list, *calls):
+        # Page numbers as the view's paginator computes them, with the
+        # COUNT(*), the page and the other calls issued at the same time.
+        paginator = view.paginator
+        page_size = paginator.get_page_size(request)
+        number = int(request.query_params.get(paginator.page_query_param, 1))
+        offset = (number - 1) * page_size
+        count, rows, *results = await gather(
+            queryset.count,
+            lambda: load(list(queryset[offset:offset + page_size])),
+            *calls
+        )
+        django_paginator = Paginator(queryset, page_size)
+        django_paginator.count = count
+        try:
+            django_paginator.validate_number(number)
+        except InvalidPage as exc:
+            raise NotFound(paginator.invalid_page_message.format(
+                page_number=number, message=str(exc)
+            ))
+        paginator.page = Page(rows, number, django_paginator)
+        paginator.request = request
+        return rows, results
+
+
+def serves_page_numbers(request, paginator_class):
+    # Anything but a plain page number, like page=last or a cursor, is
+    # left to the viewset.
+    page = request.GET.get(paginator_class.page_query_param, '1')
+    return page.isdigit() and int(page) > 0
+
+
+class CachedReadView(AsyncReadView):
+    # Anonymous responses are shared through api/response_cache.py, as
+    # in RecipesViewSet.
+    cache_scope = None
+
+    def cache_generations(self, kwargs):
+        return ()
+
+    async def get(self, view, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return await self.build(view, request, *args, **kwargs)
+        key = await database_sync_to_async(response_key)(
+            request, self.cache_scope, self.cache_generations(kwargs)
+        )
+        response = await database_sync_to_async(get_cached_response)(key)
+        if response is not None:
+            return response
+        with primary():
+            response = await self.build(view, request, *args, **kwargs)
+        response = await sync_to_async(self.finalize)(
+            view, request, response
+        )
+        return await database_sync_to_async(store_response)(key, response)
+
+
+class AsyncRecipeListView(CachedReadView):
+    viewset = RecipesViewSet
+    actions = {'get': 'list', 'post': 'create'}
+    query_budget = RecipesViewSet.query_budget['list']
+    cache_scope = 'recipes'
+
+    def cache_generations(self, kwargs):
+        return (RECIPES, RECIPE_REFS)
+
+    def serves(self, request):
+        return (
+            request.GET.get('pagination') != 'cursor'
+            and 'cursor' not in request.GET
+            and serves_page_numbers(request, RecipesViewSet.pagination_class)
+        )
+
+    async def build(self, view, request):
+        queryset = await database_sync_to_async(
+            lambda: view.filter_queryset(view.get_queryset())
+        )()
+        rows, _ = await self.paginate(
+            view, request, queryset, list,
+            *load_memberships(request, 'favorites', 'cart', 'follows')
+        )
+        data = await sync_to_async(
+            lambda: view.get_serializer(rows, many=True).data
+        )()
+        return view.get_paginated_response(data)
+
+
+class AsyncRecipeDetailView(CachedReadView):
+    viewset = RecipesViewSet
+    actions = {
+        'get': 'retrieve',
+        'put': 'update',
+        'patch': 'partial_update',
+        'delete': 'destroy',
+    }
+    query_budget = RecipesViewSet.query_budget['retrieve']
+    cache_scope = 'recipe'
+
+    def cache_generations(self, kwargs):
+        return (RECIPE.format(kwargs['pk']), RECIPE_REFS)
+
+    async def build(self, view, request, pk):
+        queryset = await database_sync_to_async(
+            lambda: view.filter_queryset(view.get_queryset()).filter(pk=pk)
+        )()
+        rows, *_ = await gather(
+            partial(list, queryset),
+            *load_memberships(request, 'favorites', 'cart', 'follows')
+        )
+        if not rows:
+            raise NotFound()
+        view.check_object_permissions(request, rows[0])
+        data = await sync_to_async(lambda: view.get_serializer(rows[0]).data)()
+        return Response(data)
+
+
+class AsyncSubscriptionsView(AsyncReadView):
+    viewset = AllFollowingView
+    actions = {'get': 'list', 'post': 'create'}
+    query_budget = AllFollowingView.query_budget
+
+    def serves(self, request):
+        return serves_page_numbers(request, AllFollowingView.pagination_class)
+
+    async def get(self, view, request):
+        queryset = await database_sync_to_async(
+            lambda: view.filter_queryset(view.get_queryset())
+        )()
+        rows, _ = await self.paginate(
+            view, request, queryset, view.prefetch_latest_recipes,
+            *load_memberships(request, 'follows')
+        )
+        data = await sync_to_async(
+            lambda: view.get_serializer(rows, many=True).data
+        )()
+        return view.get_paginated_response(data)
+
+
+class AsyncTagListView(AsyncReadView):
+    viewset = TagViewSet
+    actions = {'get': 'list'}
+    query_budget = TagViewSet.query_budget
+
+
+class AsyncIngredientListView(AsyncReadView):
+    viewset = IngredientsViewSet
+    actions = {'get': 'list', 'post': 'create'}
+    query_budget = IngredientsViewSet.query_budget
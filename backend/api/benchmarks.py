@@ -0,0 +1,323 @@
+import asyncio
+import gc
+import io
+import itertools
+import statistics
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipe.models import Favorite, ShoppingCart, Tags
+from recipe.search import rebuild_search_index
+from users.models import Follow, User
+
+from .seed_scale import ScaleSeeder
+
+INGREDIENTS_PER_RECIPE = 8
+# Power law exponent of authorship and ingredient use in the dataset.
+SEED_ALPHA = 1.0
+# Absolute slack on top of the relative threshold, differences below
+# these are noise.
+LATENCY_FLOOR_MS = 5
+MEMORY_FLOOR_KB = 256
+
+
+def seed(size, seed_value=0):
+    # A dataset of `size` recipes by size // 10 authors, generated by
+    # api/seed_scale.py, and the benchmark user who follows, favorites
+    # and carts some of them.
+    seeder = ScaleSeeder(seed_value, chunk_size=1000)
+    seeder.seed_reference_data()
+    seeder.seed_users(max(size // 10, 2))
+    seeder.seed_recipes(size, SEED_ALPHA)
+    seeder.seed_recipe_ingredients(INGREDIENTS_PER_RECIPE, SEED_ALPHA)
+    rng = seeder.rng
+    user = User.objects.create_user(
+        email='bench@example.com', password='bench1234', username='bench'
+    )
+    Favorite.objects.bulk_create(
+        Favorite(user=user, recipe_id=recipe_id)
+        for recipe_id in rng.sample(seeder.recipe_ids, size // 5)
+    )
+    ShoppingCart.objects.bulk_create(
+        ShoppingCart(user=user, recipe_id=recipe_id)
+        for recipe_id in rng.sample(seeder.recipe_ids, min(size, 10))
+    )
+    Follow.objects.bulk_create(
+        Follow(user=user, following_id=author_id)
+        for author_id in seeder.user_ids[:20]
+    )
+    # Bulk writes skip the signals.
+    call_command('recount', stdout=io.StringIO())
+    rebuild_search_index()
+    return {
+        'token': Token.objects.create(user=user).key,
+        'recipe': seeder.recipe_ids[-1],
+        'ingredients': sorted(seeder.ingredients)[:INGREDIENTS_PER_RECIPE],
+    }
+
+
+def recipe_payload(data, name):
+    return {
+        'tags': list(Tags.objects.values_list('id', flat=True)[:2]),
+        'ingredients': [
+            {'id': ingredient_id, 'amount': 10}
+            for ingredient_id in data['ingredients']
+        ],
+        'name': name,
+        'text': 'Benchmark recipe',
+        'cooking_time': 15,
+    }
+
+
+def consume(response):
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response
+
+
+# name: request(client, data, iteration), every route of api/urls.py
+# that matters for latency.
+ENDPOINTS = {
+    'recipes_list': lambda client, data, i: client.get(
+        '/api/recipes/', {'limit': 6}
+    ),
+    'recipes_list_filtered': lambda client, data, i: client.get(
+        '/api/recipes/',
+        {'tags': 'breakfast', 'is_favorited': 1, 'cooking_time__lte': 60}
+    ),
+    'recipes_search': lambda client, data, i: client.get(
+        '/api/recipes/', {'search': 'recipe 1'}
+    ),
+    'recipes_cursor': lambda client, data, i: client.get(
+        '/api/recipes/', {'pagination': 'cursor'}
+    ),
+    'recipe_detail': lambda client, data, i: client.get(
+        f'/api/recipes/{data["recipe"]}/'
+    ),
+    'recipe_create': lambda client, data, i: client.post(
+        '/api/recipes/', recipe_payload(data, f'Created {i}'),
+        format='json'
+    ),
+    'recipe_update': lambda client, data, i: client.patch(
+        f'/api/recipes/{data["recipe"]}/',
+        recipe_payload(data, f'Updated {i}'), format='json'
+    ),
+    'what_can_i_cook': lambda client, data, i: client.get(
+        '/api/recipes/what_can_i_cook/',
+        {'ingredients': ','.join(map(str, data['ingredients'][:4]))}
+    ),
+    'favorite': lambda client, data, i: client.post(
+        f'/api/recipes/{data["recipe"]}/favorite/'
+    ),
+    'shopping_cart': lambda client, data, i: client.post(
+        f'/api/recipes/{data["recipe"]}/shopping_cart/'
+    ),
+    'download_shopping_cart': lambda client, data, i: consume(client.get(
+        '/api/recipes/download_shopping_cart/'
+    )),
+    'subscriptions': lambda client, data, i: client.get(
+        '/api/users/subscriptions/', {'recipes_limit': 3}
+    ),
+    'ingredients_autocomplete': lambda client, data, i: client.get(
+        '/api/ingredients/', {'name': 'мо'}
+    ),
+    'tags': lambda client, data, i: client.get('/api/tags/'),
+}
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def measure(name, data, repeat):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {data["token"]}')
+    request = ENDPOINTS[name]
+    # The first request fills the per-process indexes and caches, the
+    # rest measure the steady state.
+    request(client, data, 0)
+    gc.collect()
+    timings = []
+    queries = 0
+    for iteration in range(1, repeat + 1):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = request(client, data, iteration)
+            timings.append((time.perf_counter() - started) * 1000)
+        if response.status_code >= 400:
+            raise RuntimeError(
+                f'{name} answered {response.status_code}: '
+                f'{getattr(response, "data", "")}'
+            )
+        queries = max(queries, len(captured))
+    # Measured separately, tracemalloc slows every allocation down.
+    tracemalloc.start()
+    request(client, data, repeat + 1)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'p50_ms': round(statistics.median(timings), 2),
+        'p95_ms': round(percentile(timings, 0.95), 2),
+        'queries': queries,
+        'peak_kb': round(peak / 1024),
+    }
+
+
+def run_benchmarks(size, repeat, endpoints=None):
+    cache.clear()
+    data = seed(size)
+    return {
+        name: measure(name, data, repeat)
+        for name in endpoints or ENDPOINTS
+    }
+
+
+def compare(results, baseline, threshold):
+    # Returns a message for every endpoint and size that got worse than
+    # the baseline: any extra query, or latency and memory beyond the
+    # threshold and the noise floor.
+    regressions = []
+    for size, endpoints in results.items():
+        for name, current in endpoints.items():
+            previous = baseline.get(size, {}).get(name)
+            if previous is None:
+                continue
+            label = f'{name} @ {size}'
+            if current['queries'] > previous['queries']:
+                regressions.append(
+                    f'{label}: {current["queries"]} queries, '
+                    f'baseline {previous["queries"]}'
+                )
+            # p95 over a few dozen requests is too noisy to gate on.
+            for metric, floor in (
+                ('p50_ms', LATENCY_FLOOR_MS), ('peak_kb', MEMORY_FLOOR_KB)
+            ):
+                limit = max(
+                    previous[metric] * (1 + threshold),
+                    previous[metric] + floor
+                )
+                if current[metric] > limit:
+                    regressions.append(
+                        f'{label}: {metric} {current[metric]}, '
+                        f'baseline {previous[metric]}'
+                    )
+    return regressions
+
+
+# The read endpoints api/async_views.py serves, requested in turn.
+def serving_paths(data):
+    return [
+        ('/api/recipes/', {'limit': 6}),
+        (f'/api/recipes/{data["recipe"]}/', {}),
+        ('/api/users/subscriptions/', {'recipes_limit': 3}),
+        ('/api/tags/', {}),
+        ('/api/ingredients/', {}),
+    ]
+
+
+def check_status(path, response):
+    if response.status_code != 200:
+        raise RuntimeError(f'{path} answered {response.status_code}')
+
+
+def serve_wsgi(paths, token, concurrency, total):
+    # Threads of one process, like gunicorn --threads.
+    counter = itertools.count()
+    timings = []
+
+    def worker():
+        client = Client(HTTP_AUTHORIZATION=f'Token {token}')
+        try:
+            while (number := next(counter)) < total:
+                path, params = paths[number % len(paths)]
+                started = time.perf_counter()
+                check_status(path, client.get(path, params))
+                timings.append((time.perf_counter() - started) * 1000)
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        for future in [executor.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    return timings
+
+
+def serve_asgi(paths, token, concurrency, total):
+    # Concurrent requests on one event loop, like an ASGI server worker.
+    counter = itertools.count()
+    timings = []
+    executor = ThreadPoolExecutor(concurrency)
+
+    async def worker(client):
+        while (number := next(counter)) < total:
+            path, params = paths[number % len(paths)]
+            started = time.perf_counter()
+            check_status(path, await client.get(
+                path, params, AUTHORIZATION=f'Token {token}'
+            ))
+            timings.append((time.perf_counter() - started) * 1000)
+
+    def close_connections(barrier):
+        # One call per worker thread, the barrier keeps them apart.
+        connections.close_all()
+        barrier.wait()
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(executor)
+        client = AsyncClient()
+        try:
+            await asyncio.gather(
+                *(worker(client) for _ in range(concurrency))
+            )
+        finally:
+            barrier = threading.Barrier(concurrency)
+            await asyncio.gather(*(
+                loop.run_in_executor(executor, close_connections, barrier)
+                for _ in range(concurrency)
+            ))
+            await sync_to_async(connections.close_all)()
+
+    with override_settings(ROOT_URLCONF='foodgram.async_urls'):
+        asyncio.run(main())
+    return timings
+
+
+SERVING_MODES = {'wsgi': serve_wsgi, 'asgi': serve_asgi}
+
+
+def compare_serving(size, concurrency, total):
+    # Throughput of the read endpoints with sync views in threads and
+    # with async views, per second and per CPU second of this process.
+    # On SQLite the database work is part of the CPU time.
+    cache.clear()
+    data = seed(size)
+    paths = serving_paths(data)
+    results = {}
+    for mode, serve in SERVING_MODES.items():
+        # Warm the caches and connections, then measure.
+        serve(paths, data['token'], concurrency, len(paths))
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        timings = serve(paths, data['token'], concurrency, total)
+        elapsed = time.perf_counter() - started
+        cpu = time.process_time() - cpu_started
+        results[mode] = {
+            'requests_per_s': round(total / elapsed, 1),
+            'requests_per_cpu_s': round(total / cpu, 1) if cpu else 0,
+            'p50_ms': round(statistics.median(timings), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+        }
+    return results
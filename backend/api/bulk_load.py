@@ -0,0 +1,109 @@
+import csv
+import io
+
+from django.db import connection
+
+COPY_NULL = '\\N'
+# Ids per DELETE, below the bound parameter limit of older SQLite.
+DELETE_BATCH = 500
+
+
+def staging_table(model):
+    return f'{model._meta.db_table}_staging'
+
+
+def copy_insert(model, fields, rows):
+    # PostgreSQL only: COPY the rows into a temporary staging table and
+    # move them with one INSERT ... ON CONFLICT DO NOTHING, so rows that
+    # break a unique constraint are skipped like with ignore_conflicts.
+    table = model._meta.db_table
+    staging = staging_table(model)
+    columns = ', '.join(
+        connection.ops.quote_name(model._meta.get_field(field).column)
+        for field in fields
+    )
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(
+            COPY_NULL if value is None else value for value in row
+        )
+    buffer.seek(0)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TEMPORARY TABLE IF NOT EXISTS {staging} AS '
+            f'SELECT {columns} FROM {table} WITH NO DATA'
+        )
+        cursor.execute(f'TRUNCATE {staging}')
+        cursor.copy_expert(
+            f"COPY {staging} ({columns}) FROM STDIN "
+            f"WITH (FORMAT csv, NULL '{COPY_NULL}')",
+            buffer
+        )
+        cursor.execute(
+            f'INSERT INTO {table} ({columns}) '
+            f'SELECT {columns} FROM {staging} ON CONFLICT DO NOTHING'
+        )
+        return cursor.rowcount
+
+
+def drop_staging_table(model):
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {staging_table(model)}')
+
+
+def values_insert(model, fields, rows):
+    # One INSERT ... ON CONFLICT DO NOTHING per row, for SQLite. Unlike
+    # bulk_create it leaves auto_now_add fields alone, the given values
+    # are kept as COPY keeps them.
+    fields = [model._meta.get_field(field) for field in fields]
+    columns = ', '.join(
+        connection.ops.quote_name(field.column) for field in fields
+    )
+    placeholders = ', '.join(['%s'] * len(fields))
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {connection.ops.quote_name(model._meta.db_table)} '
+            f'({columns}) VALUES ({placeholders}) ON CONFLICT DO NOTHING',
+            [
+                [
+                    field.get_db_prep_save(value, connection)
+                    for field, value in zip(fields, row)
+                ]
+                for row in rows
+            ]
+        )
+
+
+def insert_rows(model, fields, rows):
+    # Rows are tuples of database values for fields, foreign keys as
+    # ids. Every NOT NULL column must be among the fields for COPY.
+    if connection.vendor == 'postgresql':
+        return copy_insert(model, fields, rows)
+    values_insert(model, fields, rows)
+    return None
+
+
+def delete_pks(model, pks):
+    # DELETE by primary key, one statement per batch of ids, without
+    # loading the rows to send post_delete for each of them. Callers do
+    # the bookkeeping of those receivers themselves.
+    pks = list(pks)
+    table = connection.ops.quote_name(model._meta.db_table)
+    column = connection.ops.quote_name(model._meta.pk.column)
+    with connection.cursor() as cursor:
+        for start in range(0, len(pks), DELETE_BATCH):
+            batch = pks[start:start + DELETE_BATCH]
+            cursor.execute(
+                f'DELETE FROM {table} WHERE {column} IN '
+                f'({", ".join(["%s"] * len(batch))})',
+                batch
+            )
+    return len(pks)
+
+
+def delete_rows(queryset):
+    return delete_pks(
+        queryset.model, queryset.values_list('pk', flat=True)
+    )
@@ -0,0 +1,213 @@
+import random
+import threading
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter
+from itertools import chain
+
+from django.core.cache import cache
+from django.db import transaction
+
+from recipe.models import RecipeIngredients
+
+from .db_router import primary
+
+COOK_INDEX_SEQUENCE_KEY = 'cook_index_sequence'
+COOK_INDEX_CHANGE_KEY = 'cook_index_change:{}'
+# Workers that fall further behind than this rebuild from scratch.
+MAX_JOURNAL_LENGTH = 1000
+JOURNAL_TIMEOUT = 60 * 60 * 24
+
+
+class CookIndex:
+    # Inverted index: ingredient id -> sorted array of recipe ids, plus
+    # the ingredient set of every recipe for coverage and updates.
+
+    def __init__(self):
+        self.postings = {}
+        self.recipes = {}
+
+    def load(self, pairs):
+        recipes = {}
+        for recipe_id, ingredient_id in pairs:
+            recipes.setdefault(recipe_id, set()).add(ingredient_id)
+        for recipe_id, ingredient_ids in recipes.items():
+            self.recipes[recipe_id] = frozenset(ingredient_ids)
+        postings = {}
+        for recipe_id in sorted(self.recipes):
+            for ingredient_id in self.recipes[recipe_id]:
+                postings.setdefault(ingredient_id, array('q')).append(
+                    recipe_id
+                )
+        self.postings = postings
+
+    def remove(self, recipe_id):
+        for ingredient_id in self.recipes.pop(recipe_id, ()):
+            posting = self.postings[ingredient_id]
+            position = bisect_left(posting, recipe_id)
+            if position < len(posting) and posting[position] == recipe_id:
+                del posting[position]
+
+    def replace(self, recipe_id, ingredient_ids):
+        self.remove(recipe_id)
+        if not ingredient_ids:
+            return
+        self.recipes[recipe_id] = frozenset(ingredient_ids)
+        for ingredient_id in ingredient_ids:
+            insort(
+                self.postings.setdefault(ingredient_id, array('q')),
+                recipe_id
+            )
+
+    def rank(self, ingredient_ids):
+        matched = Counter(chain.from_iterable(
+            self.postings.get(ingredient_id, ())
+            for ingredient_id in set(ingredient_ids)
+        ))
+        # Recipes are grouped by (matched, total) instead of sorted one
+        # by one: there are only a few distinct pairs.
+        buckets = {}
+        recipes = self.recipes
+        for recipe_id, count in matched.items():
+            key = (count, len(recipes[recipe_id]))
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = []
+            bucket.append(recipe_id)
+        return RankedRecipes(buckets)
+
+
+class RankedRecipes:
+    # Sequence of (recipe id, coverage, missing) for every recipe that
+    # uses at least one of the ingredients, best coverage first, then
+    # fewer missing ingredients, then newer recipes. Only the buckets a
+    # slice touches get sorted, which is what the paginator needs.
+
+    def __init__(self, buckets):
+        self.buckets = sorted(
+            buckets.items(),
+            key=lambda item: (
+                item[0][0] / item[0][1], item[0][0] - item[0][1]
+            ),
+            reverse=True
+        )
+        self.sorted = set()
+        self.length = sum(len(bucket) for _, bucket in self.buckets)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop, _ = index.indices(self.length)
+        found = []
+        offset = 0
+        for position, ((count, total), bucket) in enumerate(self.buckets):
+            if offset >= stop:
+                break
+            if offset + len(bucket) > start:
+                if position not in self.sorted:
+                    bucket.sort(reverse=True)
+                    self.sorted.add(position)
+                found.extend(
+                    (recipe_id, count / total, total - count)
+                    for recipe_id in bucket[
+                        max(start - offset, 0):stop - offset
+                    ]
+                )
+            offset += len(bucket)
+        return found
+
+
+class CookIndexHolder:
+    # One index per process. Writers append the changed recipe ids to a
+    # journal in the shared cache, and every process replays the entries
+    # it has not seen yet before answering.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+        self._sequence = None
+
+    def current_sequence(self):
+        sequence = cache.get(COOK_INDEX_SEQUENCE_KEY)
+        if sequence is None:
+            start_sequence()
+            sequence = cache.get(COOK_INDEX_SEQUENCE_KEY)
+        return sequence
+
+    def rebuild(self, sequence):
+        index = CookIndex()
+        index.load(RecipeIngredients.objects.values_list(
+            'recipe_id', 'related_ingredient_id'
+        ).iterator())
+        self._index = index
+        self._sequence = sequence
+
+    def changed_recipes(self, sequence):
+        if not 0 < sequence - self._sequence <= MAX_JOURNAL_LENGTH:
+            return None
+        keys = [
+            COOK_INDEX_CHANGE_KEY.format(number)
+            for number in range(self._sequence + 1, sequence + 1)
+        ]
+        changes = cache.get_many(keys)
+        if len(changes) != len(keys):
+            return None
+        return set(chain.from_iterable(changes.values()))
+
+    def get(self):
+        sequence = self.current_sequence()
+        # Replayed changes are not read again, so never from a replica.
+        with self._lock, primary():
+            # Without a shared cache there is no journal to replay.
+            if self._index is None or None in (sequence, self._sequence):
+                self.rebuild(sequence)
+            elif sequence != self._sequence:
+                recipe_ids = self.changed_recipes(sequence)
+                if recipe_ids is None:
+                    self.rebuild(sequence)
+                else:
+                    self.apply(recipe_ids)
+                    self._sequence = sequence
+            return self._index
+
+    def apply(self, recipe_ids):
+        ingredients = {recipe_id: set() for recipe_id in recipe_ids}
+        for recipe_id, ingredient_id in RecipeIngredients.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'related_ingredient_id'):
+            ingredients[recipe_id].add(ingredient_id)
+        for recipe_id, ingredient_ids in ingredients.items():
+            self._index.replace(recipe_id, ingredient_ids)
+
+    def rank(self, ingredient_ids):
+        return self.get().rank(ingredient_ids)
+
+
+cook_index = CookIndexHolder()
+
+
+def start_sequence():
+    # A random start: after the key is evicted no process can mistake
+    # the new sequence for the one it has already replayed.
+    cache.add(COOK_INDEX_SEQUENCE_KEY, random.getrandbits(48), timeout=None)
+
+
+def journal_recipe_changes(*recipe_ids):
+    try:
+        sequence = cache.incr(COOK_INDEX_SEQUENCE_KEY)
+    except ValueError:
+        start_sequence()
+        sequence = cache.incr(COOK_INDEX_SEQUENCE_KEY)
+    cache.set(
+        COOK_INDEX_CHANGE_KEY.format(sequence),
+        list(recipe_ids),
+        timeout=JOURNAL_TIMEOUT
+    )
+
+
+def recipes_changed(*recipe_ids):
+    # Other processes must not replay the change before it is visible.
+    transaction.on_commit(lambda: journal_recipe_changes(*recipe_ids))
@@ -0,0 +1,8 @@
+from django.db.backends.postgresql import base
+
+from api.db_pool import PoolMetricsMixin
+
+
+class DatabaseWrapper(PoolMetricsMixin, base.DatabaseWrapper):
+    # PostgreSQL with connection reuse counters, see api/db_pool.py
+    pass
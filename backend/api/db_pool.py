@@ -0,0 +1,103 @@
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+POOL_COUNTERS = (
+    'acquired', 'reused', 'opened', 'failed', 'closed',
+    'health_check_failures',
+)
+
+_lock = threading.Lock()
+_counters = dict.fromkeys(POOL_COUNTERS, 0)
+_wait = {'total_ms': 0.0, 'max_ms': 0.0}
+
+
+def record(name, wait_ms=None):
+    with _lock:
+        _counters[name] += 1
+        if wait_ms is not None:
+            _wait['total_ms'] += wait_ms
+            _wait['max_ms'] = max(_wait['max_ms'], wait_ms)
+
+
+def reset_pool_stats():
+    with _lock:
+        _counters.update(dict.fromkeys(POOL_COUNTERS, 0))
+        _wait.update(total_ms=0.0, max_ms=0.0)
+
+
+class PoolMetricsMixin:
+    # Django keeps one connection per thread and reuses it while it is
+    # younger than CONN_MAX_AGE and passes the health check. This counts
+    # how often a request or job acquires that connection, how often it
+    # had to be opened, and the time spent waiting for the database to
+    # accept it.
+    pool_acquired = False
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            super().connect()
+        except Exception:
+            record('failed')
+            raise
+        record('opened', (time.perf_counter() - started) * 1000)
+
+    def ensure_connection(self):
+        if not self.pool_acquired:
+            self.pool_acquired = True
+            record('acquired')
+            if self.connection is not None:
+                record('reused')
+        super().ensure_connection()
+
+    def close_if_health_check_failed(self):
+        checked = self.connection is not None
+        super().close_if_health_check_failed()
+        if checked and self.connection is None:
+            record('health_check_failures')
+
+    def close_if_unusable_or_obsolete(self):
+        # Runs when every request starts and finishes, its own checks
+        # are not counted as an acquisition.
+        self.pool_acquired = True
+        try:
+            super().close_if_unusable_or_obsolete()
+        finally:
+            self.pool_acquired = False
+
+    def _close(self):
+        self.pool_acquired = False
+        record('closed')
+        return super()._close()
+
+
+def pool_stats():
+    # Counters of this process, every gunicorn worker has its own
+    # connections.
+    database = settings.DATABASES['default']
+    with _lock:
+        counters = dict(_counters)
+        wait = dict(_wait)
+    return {
+        'pid': os.getpid(),
+        'metrics': isinstance(connections['default'], PoolMetricsMixin),
+        'conn_max_age': database.get('CONN_MAX_AGE'),
+        'health_checks': database.get('CONN_HEALTH_CHECKS'),
+        'server_side_cursors': not database.get(
+            'DISABLE_SERVER_SIDE_CURSORS'
+        ),
+        **counters,
+        'open': counters['opened'] - counters['closed'],
+        'reuse_ratio': round(
+            counters['reused'] / counters['acquired'], 4
+        ) if counters['acquired'] else 0,
+        'wait_ms': round(wait['total_ms'], 1),
+        'avg_wait_ms': round(
+            wait['total_ms'] / counters['opened'], 2
+        ) if counters['opened'] else 0,
+        'max_wait_ms': round(wait['max_ms'], 1),
+    }
@@ -0,0 +1,125 @@
+import asyncio
+import hashlib
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import Resolver404, resolve
+from rest_framework.permissions import SAFE_METHODS
+
+PRIMARY_PIN_KEY = 'db_primary:{}'
+# Reads stay on the primary unless the request being served allows the
+# replicas, so management commands, jobs and writes never see lag.
+replica_reads = ContextVar('replica_reads', default=False)
+
+
+@contextmanager
+def primary():
+    # For reads whose result outlives the request, like the shared
+    # caches: filled from a lagging replica they would stay stale until
+    # the next write invalidates them.
+    token = replica_reads.set(False)
+    try:
+        yield
+    finally:
+        replica_reads.reset(token)
+
+
+class ReplicaRouter:
+    # Sends the reads of views with replica_reads = True to a random
+    # replica from DATABASE_REPLICAS, everything else to the primary.
+
+    def db_for_read(self, model, **hints):
+        # A token issued a moment ago has to work on the next request.
+        if (
+            not settings.DATABASE_REPLICAS
+            or not replica_reads.get()
+            or model._meta.app_label == 'authtoken'
+        ):
+            return 'default'
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas hold the same rows as the primary.
+        return True
+
+
+def pin_key(request):
+    # Clients are told apart by their token or session, both are known
+    # before the view authenticates the request.
+    credentials = request.META.get('HTTP_AUTHORIZATION') or (
+        request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    )
+    if not credentials:
+        return None
+    return PRIMARY_PIN_KEY.format(
+        hashlib.sha256(credentials.encode()).hexdigest()
+    )
+
+
+def routed_view(request):
+    try:
+        match = resolve(request.path_info, getattr(request, 'urlconf', None))
+    except Resolver404:
+        return None
+    return getattr(match.func, 'cls', None)
+
+
+def allows_replica_reads(request):
+    if not settings.DATABASE_REPLICAS or request.method not in SAFE_METHODS:
+        return False
+    if not getattr(routed_view(request), 'replica_reads', False):
+        return False
+    key = pin_key(request)
+    return key is None or not cache.get(key)
+
+
+def pin_to_primary(request):
+    # Read-your-writes: after a write the client reads from the primary
+    # until the replicas have caught up.
+    if request.method in SAFE_METHODS or not settings.DATABASE_REPLICAS:
+        return
+    key = pin_key(request)
+    if key is not None:
+        cache.set(key, True, settings.DB_PRIMARY_STICKY_SECONDS)
+
+
+class ReplicaRoutingMiddleware:
+    # Decides per request whether its reads may go to the replicas. The
+    # context variable is set here and not in process_view, so it also
+    # reaches the async views and the threads they query in.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        token = replica_reads.set(allows_replica_reads(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            replica_reads.reset(token)
+        pin_to_primary(request)
+        return response
+
+    async def __acall__(self, request):
+        # URL resolving and the cache are blocking, kept off the loop.
+        allowed = await sync_to_async(allows_replica_reads)(request)
+        token = replica_reads.set(allowed)
+        try:
+            response = await self.get_response(request)
+        finally:
+            replica_reads.reset(token)
+        await sync_to_async(pin_to_primary)(request)
+        return response
@@ -1,36 +1,219 @@
-from django.http import HttpResponse
+import csv
+import io
+import json
+import os
+import uuid
+from functools import lru_cache
 
-from recipe.models import Ingredients, RecipeIngredients
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Sum
+from django.http import StreamingHttpResponse
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
 
+from recipe.models import RecipeIngredients, ShoppingCart
 
-def download_shopping_cart(shopping_ids):
-    ingredients_for_shopping = {}
+SHOPPING_LIST_HEADER = 'Ingredients for shopping :)\n'
+CART_VERSION_KEY = 'shopping_cart_version:{}'
+CATALOGUE_VERSION_KEY = 'shopping_cart_catalogue_version'
+RENDERED_CART_KEY = 'shopping_cart:{user_id}:{catalogue}:{cart}:{format}'
+CHUNK_SIZE = 64 * 1024
+PDF_FONT_NAME = 'ShoppingListFont'
 
-    for shopping_id in shopping_ids:
-        ingredients_obj = RecipeIngredients.objects.filter(
-            recipe_id=shopping_id
+
+def aggregate_shopping_cart(shopping_ids):
+    # One grouped query for the whole cart: shopping_ids is compiled
+    # into a subquery, so the cost does not depend on the cart size.
+    return (
+        RecipeIngredients.objects
+        .filter(recipe_id__in=shopping_ids)
+        .values('related_ingredient')
+        .annotate(
+            name=F('related_ingredient__name'),
+            measurement_unit=F('related_ingredient__measurement_unit'),
+            total=Sum('quantity'),
+        )
+        .values_list('name', 'measurement_unit', 'total')
+        .order_by('name')
+    )
+
+
+def shopping_list_lines(ingredients):
+    yield SHOPPING_LIST_HEADER
+    for name, measurement_unit, total in ingredients:
+        yield f'{name} {measurement_unit} {total or 0}\n'
+
+
+class Echo:
+    # File-like object for csv.writer that hands the row back instead of
+    # buffering it, so rows can be streamed one by one.
+    def write(self, value):
+        return value
+
+
+def render_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for name, measurement_unit, total in ingredients:
+        yield writer.writerow((name, measurement_unit, total or 0))
+
+
+def render_json(ingredients):
+    yield '['
+    separator = ''
+    for name, measurement_unit, total in ingredients:
+        item = json.dumps(
+            {
+                'name': name,
+                'measurement_unit': measurement_unit,
+                'amount': total or 0,
+            },
+            ensure_ascii=False
+        )
+        yield f'{separator}{item}'
+        separator = ', '
+    yield ']'
+
+
+@lru_cache(maxsize=None)
+def get_pdf_font():
+    # Ingredient names are Cyrillic, which the built-in PDF fonts lack.
+    font_path = settings.SHOPPING_LIST_PDF_FONT
+    if font_path and os.path.exists(font_path):
+        pdfmetrics.registerFont(TTFont(PDF_FONT_NAME, font_path))
+        return PDF_FONT_NAME
+    return 'Helvetica'
+
+
+def render_pdf(ingredients):
+    font = get_pdf_font()
+    font_size = 12
+    margin = 50
+    width, height = A4
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    pdf.setFont(font, font_size)
+    position = height - margin
+    for line in shopping_list_lines(ingredients):
+        if position < margin:
+            pdf.showPage()
+            pdf.setFont(font, font_size)
+            position = height - margin
+        pdf.drawString(margin, position, line.rstrip('\n'))
+        position -= font_size * 1.5
+    pdf.save()
+    yield buffer.getvalue()
+
+
+SHOPPING_LIST_FORMATS = {
+    'txt': ('text/plain', shopping_list_lines),
+    'csv': ('text/csv', render_csv),
+    'json': ('application/json', render_json),
+    'pdf': ('application/pdf', render_pdf),
+}
+
+
+def new_version():
+    # Random versions instead of counters: a version key evicted from
+    # the cache must never come back with a value used before.
+    return uuid.uuid4().hex
+
+
+def get_cart_version(user_id):
+    return cache.get_or_set(
+        CART_VERSION_KEY.format(user_id), new_version, timeout=None
+    )
+
+
+def bump_cart_version(*user_ids):
+    # After commit: a list rendered from the old cart in the meantime is
+    # cached under the old version and never served again.
+    def bump():
+        cache.set_many(
+            {CART_VERSION_KEY.format(user_id): new_version()
+             for user_id in user_ids},
+            timeout=None
+        )
+    transaction.on_commit(bump)
+
+
+def bump_recipe_carts(*recipe_ids):
+    user_ids = ShoppingCart.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('user_id', flat=True).distinct()
+    bump_cart_version(*user_ids)
+
+
+def bump_catalogue_version():
+    transaction.on_commit(
+        lambda: cache.set(CATALOGUE_VERSION_KEY, new_version(), timeout=None)
+    )
+
+
+def rendered_cart_key(user_id, file_format):
+    catalogue = cache.get_or_set(
+        CATALOGUE_VERSION_KEY, new_version, timeout=None
+    )
+    return RENDERED_CART_KEY.format(
+        user_id=user_id,
+        catalogue=catalogue,
+        cart=get_cart_version(user_id),
+        format=file_format,
+    )
+
+
+def encode(chunks):
+    for chunk in chunks:
+        yield chunk.encode() if isinstance(chunk, str) else chunk
+
+
+def iter_cached(content):
+    for start in range(0, len(content), CHUNK_SIZE):
+        yield content[start:start + CHUNK_SIZE]
+
+
+def cache_while_streaming(key, chunks):
+    rendered = []
+    for chunk in chunks:
+        rendered.append(chunk)
+        yield chunk
+    cache.set(
+        key, b''.join(rendered), settings.SHOPPING_LIST_CACHE_TIMEOUT
+    )
+
+
+def download_shopping_cart(user_id, shopping_ids, file_format='txt'):
+    content_type, renderer = SHOPPING_LIST_FORMATS[file_format]
+    key = rendered_cart_key(user_id, file_format)
+    content = cache.get(key)
+    if content is not None:
+        chunks = iter_cached(content)
+    else:
+        ingredients = aggregate_shopping_cart(shopping_ids).iterator()
+        chunks = cache_while_streaming(key, encode(renderer(ingredients)))
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = (
+        f'attachment; filename="shopping_list.{file_format}"'
+    )
+    return response
+
+
+def render_shopping_cart(user_id, file_format='txt'):
+    # Fills the cache for download_shopping_cart ahead of the download,
+    # used by the background job.
+    key = rendered_cart_key(user_id, file_format)
+    content = cache.get(key)
+    if content is None:
+        _, renderer = SHOPPING_LIST_FORMATS[file_format]
+        shopping_ids = ShoppingCart.objects.filter(
+            user_id=user_id
+        ).values_list('recipe', flat=True)
+        ingredients = aggregate_shopping_cart(shopping_ids).iterator()
+        content = b''.join(
+            cache_while_streaming(key, encode(renderer(ingredients)))
         )
-        ingredient = Ingredients.objects.get(id=shopping_id)
-        for ingredient_obj in ingredients_obj:
-            cart_obj_id = ingredient_obj.related_ingredient_id
-            quantity = ingredient_obj.quantity
-            measurement_unit = ingredient.measurement_unit
-
-            if cart_obj_id in ingredients_for_shopping.keys():
-                # Add amount for existing key
-                ingredients_for_shopping[cart_obj_id][0] += quantity
-
-            else:
-                # No key in data, add
-                ingredients_for_shopping[cart_obj_id] = [quantity]
-                ingredients_for_shopping[cart_obj_id].append(measurement_unit)
-    content = 'Ingredients for shopping :)\n'
-    for key in ingredients_for_shopping.keys():
-        ingredient_name = Ingredients.objects.get(id=key)
-        print(ingredients_for_shopping)
-        content += f'' \
-                   f'{str(ingredient_name)} ' \
-                   f'{str(ingredients_for_shopping[key][1])} ' \
-                   f'{str(ingredients_for_shopping[key][0])}\n  '
-
-    return HttpResponse(content, content_type='text/plain')
+    return len(content)
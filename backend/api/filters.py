@@ -1,5 +1,8 @@
+from django import forms
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
-from recipe.models import Ingredients
+from recipe.models import Favorite, Ingredients, Recipes, ShoppingCart
+from recipe.search import search_recipes
 
 
 class IngredientsFilter(filters.FilterSet):
@@ -8,3 +11,69 @@ class IngredientsFilter(filters.FilterSet):
     class Meta:
         model = Ingredients
         fields = ['name', ]
+
+
+class SlugsField(forms.MultipleChoiceField):
+    # Any slug is accepted, unknown ones just match nothing, so the
+    # filter needs no query to build its choices.
+    def valid_value(self, value):
+        return True
+
+
+class SlugsFilter(filters.MultipleChoiceFilter):
+    field_class = SlugsField
+
+
+class RecipesFilter(filters.FilterSet):
+    # Every filter adds a condition to the same query: relations are
+    # checked with EXISTS subqueries instead of joins plus DISTINCT.
+    author = filters.NumberFilter(field_name='author_id')
+    tags = SlugsFilter(method='filter_tags')
+    tags_mode = filters.ChoiceFilter(
+        choices=(('any', 'any'), ('all', 'all')), method='filter_tags_mode'
+    )
+    is_favorited = filters.BooleanFilter(method='filter_is_favorited')
+    is_in_shopping_cart = filters.BooleanFilter(
+        method='filter_is_in_shopping_cart'
+    )
+    search = filters.CharFilter(method='filter_search')
+
+    class Meta:
+        model = Recipes
+        fields = {
+            'cooking_time': ['lte', 'gte'],
+        }
+
+    def filter_tags(self, queryset, name, value):
+        tagged = Recipes.tags.through.objects.filter(
+            recipes_id=OuterRef('pk')
+        )
+        if self.form.cleaned_data.get('tags_mode') == 'all':
+            for slug in set(value):
+                queryset = queryset.filter(
+                    Exists(tagged.filter(tags__slug=slug))
+                )
+            return queryset
+        return queryset.filter(Exists(tagged.filter(tags__slug__in=value)))
+
+    def filter_tags_mode(self, queryset, name, value):
+        # Read by filter_tags.
+        return queryset
+
+    def filter_related(self, queryset, model, value):
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.none() if value else queryset
+        related = Exists(model.objects.filter(
+            user=user, recipe=OuterRef('pk')
+        ))
+        return queryset.filter(related if value else ~related)
+
+    def filter_is_favorited(self, queryset, name, value):
+        return self.filter_related(queryset, Favorite, value)
+
+    def filter_is_in_shopping_cart(self, queryset, name, value):
+        return self.filter_related(queryset, ShoppingCart, value)
+
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
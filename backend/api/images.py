@@ -0,0 +1,80 @@
+import binascii
+import hashlib
+from base64 import b64decode
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.files import File
+from PIL import Image
+from rest_framework import serializers
+
+BASE64_MARKER = ';base64,'
+# A multiple of 4, so every chunk decodes on its own.
+CHUNK_CHARS = 4 * 16 * 1024
+IMAGE_EXTENSIONS = {
+    'JPEG': 'jpg',
+    'PNG': 'png',
+    'GIF': 'gif',
+    'WEBP': 'webp',
+}
+
+
+def decode_data_uri(data):
+    # Decodes the base64 payload chunk by chunk into a spooled file,
+    # which stays in memory up to IMAGE_UPLOAD_SPOOL_SIZE and moves to
+    # disk after that, and hashes it on the way.
+    start = data.find(BASE64_MARKER, 0, 100)
+    if start == -1:
+        raise serializers.ValidationError('Image must be base64 encoded')
+    start += len(BASE64_MARKER)
+    if (len(data) - start) // 4 * 3 > settings.IMAGE_UPLOAD_MAX_BYTES:
+        raise serializers.ValidationError('Image file is too large')
+    spooled = SpooledTemporaryFile(
+        max_size=settings.IMAGE_UPLOAD_SPOOL_SIZE
+    )
+    digest = hashlib.sha256()
+    try:
+        for position in range(start, len(data), CHUNK_CHARS):
+            chunk = b64decode(
+                data[position:position + CHUNK_CHARS], validate=True
+            )
+            digest.update(chunk)
+            spooled.write(chunk)
+    except (binascii.Error, ValueError):
+        spooled.close()
+        raise serializers.ValidationError('Invalid base64 image data')
+    spooled.seek(0)
+    return spooled, digest.hexdigest()
+
+
+def verify_image(file):
+    # Image.open only parses the header, so the dimensions are checked
+    # before any pixel data is decoded.
+    try:
+        with Image.open(file) as image:
+            width, height = image.size
+            if width * height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+                raise serializers.ValidationError(
+                    'Image dimensions are too large'
+                )
+            image_format = image.format
+            image.verify()
+    except (OSError, SyntaxError, Image.DecompressionBombError):
+        raise serializers.ValidationError('Invalid image')
+    finally:
+        file.seek(0)
+    if image_format not in IMAGE_EXTENSIONS:
+        raise serializers.ValidationError('Unsupported image format')
+    return IMAGE_EXTENSIONS[image_format]
+
+
+def ingest_data_uri(data):
+    # Returns the image as a File named after its content hash, ready to
+    # be saved by an ImageField.
+    spooled, digest = decode_data_uri(data)
+    try:
+        extension = verify_image(spooled)
+    except serializers.ValidationError:
+        spooled.close()
+        raise
+    return File(spooled, name=f'{digest}.{extension}')
@@ -0,0 +1,195 @@
+import csv
+import json
+import os
+import time
+from itertools import islice
+
+from django.db import connection, transaction
+from django.db.models import Count, Min
+
+from recipe.models import Ingredients, RecipeIngredients
+
+from .bulk_load import copy_insert, drop_staging_table
+from .cook_index import recipes_changed
+from .download_shopping_cart import bump_recipe_carts
+from .ingredients_index import invalidate_ingredients_index
+from .response_cache import bump_recipe_responses
+from .snapshots import bump_snapshot
+
+IMPORT_FORMATS = ('csv', 'json', 'jsonl')
+CHUNK_SIZE = 1000
+
+
+# Malformed rows are read as blanks, which clean() drops and counts as
+# skipped instead of failing the whole import.
+BLANK = ('', '')
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if row:
+            yield row[0], row[1] if len(row) > 1 else ''
+
+
+def text(value):
+    return value if isinstance(value, str) else ''
+
+
+def read_item(item):
+    if not isinstance(item, dict):
+        return BLANK
+    return text(item.get('name')), text(item.get('measurement_unit'))
+
+
+def read_json(file):
+    # A JSON array has to be parsed whole, use JSONL for large files.
+    for item in json.load(file):
+        yield read_item(item)
+
+
+def read_jsonl(file):
+    for line in file:
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError:
+            item = None
+        yield read_item(item)
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+    'jsonl': read_jsonl,
+}
+
+
+def guess_format(path):
+    extension = os.path.splitext(path)[1].lstrip('.').lower()
+    return extension if extension in IMPORT_FORMATS else 'csv'
+
+
+def chunked(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def clean(chunk):
+    # Dropped here, not by the database: COPY and bulk_create would both
+    # fail the whole chunk on one bad row.
+    # Returns the rows to load and the number of invalid ones.
+    rows = {}
+    skipped = 0
+    for name, measurement_unit in chunk:
+        name = name.strip()[:200]
+        measurement_unit = measurement_unit.strip()[:20]
+        if name and measurement_unit:
+            rows[(name, measurement_unit)] = None
+        else:
+            skipped += 1
+    return list(rows), skipped
+
+
+class PostgresLoader:
+    # COPY through a staging table, see api/bulk_load.py
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        drop_staging_table(Ingredients)
+
+    def load(self, rows):
+        return copy_insert(Ingredients, ('name', 'measurement_unit'), rows)
+
+
+class ORMLoader:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def load(self, rows):
+        # The backends without COPY do not report how many rows
+        # ignore_conflicts skipped, so the created ones are counted.
+        before = Ingredients.objects.count()
+        Ingredients.objects.bulk_create(
+            [
+                Ingredients(name=name, measurement_unit=measurement_unit)
+                for name, measurement_unit in rows
+            ],
+            ignore_conflicts=True
+        )
+        return Ingredients.objects.count() - before
+
+
+def import_ingredients(file, file_format='csv', chunk_size=CHUNK_SIZE,
+                       progress=None):
+    # Upserts on (name, measurement_unit) one chunk per transaction, so
+    # an interrupted import is finished by running it again.
+    loader = (
+        PostgresLoader() if connection.vendor == 'postgresql'
+        else ORMLoader()
+    )
+    stats = {'read': 0, 'created': 0, 'skipped': 0, 'seconds': 0.0}
+    started = time.monotonic()
+    with loader:
+        for chunk in chunked(READERS[file_format](file), chunk_size):
+            rows, skipped = clean(chunk)
+            with transaction.atomic():
+                created = loader.load(rows) if rows else 0
+            stats['read'] += len(chunk)
+            stats['created'] += created
+            stats['skipped'] += skipped
+            stats['seconds'] = round(time.monotonic() - started, 3)
+            if progress is not None:
+                progress(dict(stats))
+    # Neither COPY nor bulk_create send signals.
+    if stats['created']:
+        invalidate_ingredients_index()
+        bump_snapshot('ingredients')
+    return stats
+
+
+@transaction.atomic
+def merge_duplicate_ingredients():
+    # Repoints recipes from duplicates left by earlier imports to the
+    # oldest row, needed once before the unique constraint is migrated.
+    groups = Ingredients.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(keep=Min('id'), total=Count('id')).filter(total__gt=1)
+    merged = 0
+    recipe_ids = set()
+    for group in groups:
+        duplicates = Ingredients.objects.filter(
+            name=group['name'], measurement_unit=group['measurement_unit']
+        ).exclude(id=group['keep']).values_list('id', flat=True)
+        for duplicate in list(duplicates):
+            # A recipe that already uses the kept row loses its line for
+            # the duplicate instead of breaking unique_together.
+            RecipeIngredients.objects.filter(
+                related_ingredient_id=duplicate,
+                recipe_id__in=RecipeIngredients.objects.filter(
+                    related_ingredient_id=group['keep']
+                ).values('recipe_id')
+            ).delete()
+            moved = RecipeIngredients.objects.filter(
+                related_ingredient_id=duplicate
+            )
+            recipe_ids.update(moved.values_list('recipe_id', flat=True))
+            moved.update(related_ingredient_id=group['keep'])
+            Ingredients.objects.filter(id=duplicate).delete()
+            merged += 1
+    # update() sends no signals.
+    if recipe_ids:
+        bump_recipe_carts(*recipe_ids)
+        recipes_changed(*recipe_ids)
+        bump_recipe_responses(*recipe_ids)
+    return merged
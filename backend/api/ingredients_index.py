@@ -0,0 +1,92 @@
+import threading
+import uuid
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from recipe.models import Ingredients
+
+from .db_router import primary
+
+INGREDIENTS_INDEX_VERSION_KEY = 'ingredients_index_version'
+
+
+class IngredientsIndex:
+    # Names are kept casefolded in a sorted list, so a prefix lookup is
+    # a bisect plus a walk over the matching run.
+
+    def __init__(self, ingredients):
+        entries = sorted(
+            ((name or '').casefold(), pk, name, measurement_unit)
+            for pk, name, measurement_unit in ingredients
+        )
+        self.keys = [entry[0] for entry in entries]
+        self.items = [
+            {'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+            for _, pk, name, measurement_unit in entries
+        ]
+
+    def search(self, query, limit):
+        query = query.casefold()
+        found = []
+        position = bisect_left(self.keys, query)
+        prefix_end = position
+        while (
+            prefix_end < len(self.keys)
+            and self.keys[prefix_end].startswith(query)
+        ):
+            prefix_end += 1
+        found.extend(self.items[position:min(prefix_end, position + limit)])
+        for index, key in enumerate(self.keys):
+            if len(found) >= limit:
+                break
+            if position <= index < prefix_end:
+                continue
+            if query in key:
+                found.append(self.items[index])
+        return found
+
+
+class IngredientsIndexHolder:
+    # One index per process. The version lives in the shared cache, so
+    # a change made in one worker rebuilds the index in all of them.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+        self._version = None
+
+    def get(self):
+        version = cache.get_or_set(
+            INGREDIENTS_INDEX_VERSION_KEY,
+            lambda: uuid.uuid4().hex,
+            timeout=None
+        )
+        if self._index is None or self._version != version:
+            with self._lock, primary():
+                if self._index is None or self._version != version:
+                    self._index = IngredientsIndex(
+                        Ingredients.objects.values_list(
+                            'id', 'name', 'measurement_unit'
+                        )
+                    )
+                    self._version = version
+        return self._index
+
+    def search(self, query, limit=None):
+        return self.get().search(
+            query, limit or settings.INGREDIENTS_SEARCH_LIMIT
+        )
+
+
+ingredients_index = IngredientsIndexHolder()
+
+
+def invalidate_ingredients_index():
+    # After commit, or another process could rebuild from the old rows
+    # and keep that index as current.
+    transaction.on_commit(lambda: cache.set(
+        INGREDIENTS_INDEX_VERSION_KEY, uuid.uuid4().hex, timeout=None
+    ))
@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# IN lists of any length have the same shape.
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def query_shape(sql):
+    return IN_LIST.sub('IN (...)', sql)
+
+
+class QueryRecorder:
+    # execute_wrapper hook, records the SQL and duration of every query
+    # run on the connections it is installed on.
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - started))
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def duration(self):
+        return sum(duration for _, duration in self.queries)
+
+    def duplicates(self, threshold):
+        # Query shapes repeated more than threshold times, the usual
+        # sign of an N+1 in a serializer.
+        shapes = Counter(query_shape(sql) for sql, _ in self.queries)
+        return [
+            (shape, count) for shape, count in shapes.most_common()
+            if count > threshold
+        ]
+
+    def slowest(self):
+        return max(self.queries, key=lambda query: query[1], default=None)
+
+
+# The recorder of the request being served. Context variables follow
+# the request into the threads sync_to_async runs its queries in.
+current_recorder = ContextVar('current_recorder', default=None)
+
+
+def record_queries(execute, sql, params, many, context):
+    recorder = current_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install_recorder(sender, connection, **kwargs):
+    # connection_created receiver, connected in api/apps.py. Reconnects
+    # reuse the wrapper object, so the hook is added once.
+    if record_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_queries)
+
+
+def get_query_budget(view_class, view):
+    # query_budget on a view is either a number or a dict by viewset
+    # action or lowercase HTTP method.
+    budget = getattr(view_class, 'query_budget', None)
+    if isinstance(budget, dict):
+        action = getattr(view, 'action', None)
+        method = getattr(getattr(view, 'request', None), 'method', '')
+        return budget.get(action, budget.get(method.lower()))
+    return budget
+
+
+class SQLInstrumentationMiddleware:
+    # Counts and times the queries of each request and reports them in a
+    # Server-Timing header. Slow requests are logged with their slowest
+    # query and repeated query shapes. With SQL_STRICT_BUDGETS a view
+    # that runs more queries than its query_budget raises.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Awaited under ASGI, the same marker MiddlewareMixin sets.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not settings.SQL_INSTRUMENTATION:
+            return self.get_response(request)
+        recorder = QueryRecorder()
+        token = current_recorder.set(recorder)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_recorder.reset(token)
+        return self.report(request, response, recorder, started)
+
+    async def __acall__(self, request):
+        if not settings.SQL_INSTRUMENTATION:
+            return await self.get_response(request)
+        recorder = QueryRecorder()
+        token = current_recorder.set(recorder)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_recorder.reset(token)
+        return self.report(request, response, recorder, started)
+
+    def report(self, request, response, recorder, started):
+        total = time.perf_counter() - started
+        duplicates = recorder.duplicates(settings.SQL_DUPLICATE_THRESHOLD)
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={recorder.duration * 1000:.1f};'
+            f'desc="{recorder.count} queries"',
+            f'app;dur={(total - recorder.duration) * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ))
+        if total * 1000 >= settings.SLOW_REQUEST_MS or duplicates:
+            self.log(request, recorder, total, duplicates)
+        self.check_budget(request, response, recorder)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._instrumented_view = getattr(view_func, 'cls', None)
+
+    def log(self, request, recorder, total, duplicates):
+        slowest = recorder.slowest()
+        logger.warning(
+            '%s %s took %.0f ms, %d queries in %.0f ms; '
+            'slowest (%.0f ms): %s; repeated: %s',
+            request.method, request.get_full_path(), total * 1000,
+            recorder.count, recorder.duration * 1000,
+            slowest[1] * 1000 if slowest else 0,
+            slowest[0] if slowest else '-',
+            '; '.join(
+                f'{count} x {shape}' for shape, count in duplicates
+            ) or '-'
+        )
+
+    def check_budget(self, request, response, recorder):
+        # The view that rendered the response, which is not the routed
+        # one when an async view falls back to a DRF view.
+        view = getattr(response, 'renderer_context', {}).get('view')
+        view_class = type(view) if view is not None else getattr(
+            request, '_instrumented_view', None
+        )
+        if view_class is None:
+            return
+        budget = get_query_budget(view_class, view)
+        if budget is None or recorder.count <= budget:
+            return
+        message = (
+            f'{view_class.__name__} ran {recorder.count} queries, '
+            f'its budget is {budget}'
+        )
+        if settings.SQL_STRICT_BUDGETS:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
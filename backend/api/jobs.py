@@ -0,0 +1,169 @@
+import logging
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, connection
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+JOB_SCHEDULE_KEY = 'job_schedule:{}'
+# name: (function, max attempts, run every n seconds or None)
+TASKS = {}
+
+
+def task(name, max_attempts=3, every=None):
+    # Registers a function as a job. Payloads are passed as keyword
+    # arguments and the return value is stored as the result, so both
+    # have to be JSON.
+    def register(function):
+        TASKS[name] = (function, max_attempts, every)
+        return function
+    return register
+
+
+def enqueue(name, payload=None, user=None, run_at=None):
+    # The row is part of the caller's transaction, so workers never
+    # pick up a job for data that was rolled back.
+    if name not in TASKS:
+        raise KeyError(f'Unknown task: {name}')
+    return Job.objects.create(
+        name=name,
+        payload=payload or {},
+        user=user,
+        max_attempts=TASKS[name][1],
+        run_at=run_at or timezone.now(),
+    )
+
+
+def claim():
+    # A conditional UPDATE per candidate instead of SELECT ... FOR
+    # UPDATE, which works the same on every backend: only one worker
+    # can move a job out of the queued state.
+    now = timezone.now()
+    candidates = Job.objects.filter(
+        status=Job.QUEUED, run_at__lte=now
+    ).order_by('run_at', 'id').values_list('id', flat=True)[:10]
+    for job_id in candidates:
+        claimed = Job.objects.filter(id=job_id, status=Job.QUEUED).update(
+            status=Job.RUNNING, started_at=now, attempts=F('attempts') + 1
+        )
+        if claimed:
+            return Job.objects.get(id=job_id)
+    return None
+
+
+def retry_delay(attempts):
+    return min(
+        settings.JOB_RETRY_DELAY * 2 ** (attempts - 1),
+        settings.JOB_MAX_RETRY_DELAY
+    )
+
+
+def run(job):
+    function = TASKS.get(job.name, (None,))[0]
+    try:
+        if function is None:
+            raise KeyError(f'Unknown task: {job.name}')
+        job.result = function(**job.payload)
+    except Exception:
+        logger.exception('Job %s failed', job)
+        job.error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            job.status = Job.QUEUED
+            job.run_at = timezone.now() + timedelta(
+                seconds=retry_delay(job.attempts)
+            )
+        else:
+            job.status = Job.FAILED
+            job.finished_at = timezone.now()
+    else:
+        job.status = Job.DONE
+        job.error = ''
+        job.finished_at = timezone.now()
+    job.save(update_fields=(
+        'status', 'result', 'error', 'run_at', 'finished_at'
+    ))
+    return job
+
+
+def requeue_stale():
+    # Jobs of a worker that died while running them. A job that has used
+    # up its attempts probably killed the worker, so it fails instead of
+    # taking down the next one.
+    now = timezone.now()
+    stale = Job.objects.filter(
+        status=Job.RUNNING,
+        started_at__lt=now - timedelta(seconds=settings.JOB_TIMEOUT)
+    )
+    stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED, finished_at=now,
+        error='The worker stopped while running the job'
+    )
+    return stale.update(status=Job.QUEUED, run_at=now)
+
+
+def schedule_periodic():
+    # The cache lock keeps several run_workers processes from queueing
+    # the same periodic job twice.
+    for name, (_, _, every) in TASKS.items():
+        if every is None:
+            continue
+        if not cache.add(JOB_SCHEDULE_KEY.format(name), 1, timeout=every):
+            continue
+        if not Job.objects.filter(
+            name=name, status__in=(Job.QUEUED, Job.RUNNING)
+        ).exists():
+            enqueue(name)
+
+
+def run_pending(stop=None):
+    # Runs jobs that are due until there are none left, in the calling
+    # thread and on its connection.
+    done = 0
+    while stop is None or not stop.is_set():
+        job = claim()
+        if job is None:
+            break
+        run(job)
+        done += 1
+    return done
+
+
+def worker(stop, burst=False):
+    try:
+        while not stop.is_set():
+            close_old_connections()
+            ran = run_pending(stop)
+            if burst:
+                break
+            if not ran:
+                stop.wait(settings.JOB_POLL_INTERVAL)
+    finally:
+        connection.close()
+
+
+def run_workers(threads, stop=None, burst=False):
+    stop = stop or threading.Event()
+    requeue_stale()
+    schedule_periodic()
+    workers = [
+        threading.Thread(target=worker, args=(stop, burst), daemon=True)
+        for _ in range(threads)
+    ]
+    for thread in workers:
+        thread.start()
+    while True:
+        alive = [thread for thread in workers if thread.is_alive()]
+        if not alive:
+            break
+        alive[0].join(settings.JOB_POLL_INTERVAL * 10)
+        if not stop.is_set():
+            requeue_stale()
+            schedule_periodic()
@@ -0,0 +1,119 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (setup_test_environment,
+                               teardown_test_environment)
+
+from api.benchmarks import (ENDPOINTS, compare, compare_serving,
+                            run_benchmarks)
+
+DEFAULT_BASELINE = os.path.join(
+    settings.BASE_DIR, 'data/benchmark_baseline.json'
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the API endpoints on seeded datasets in a throwaway '
+        'test database and compare with the baseline'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', default='100,1000',
+            help='Comma separated numbers of recipes to seed'
+        )
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument(
+            '--endpoint', action='append', choices=sorted(ENDPOINTS),
+            help='Only these endpoints, may be repeated'
+        )
+        parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+        parser.add_argument(
+            '--threshold', type=float, default=0.5,
+            help='Allowed relative growth of latency and memory'
+        )
+        parser.add_argument(
+            '--update-baseline', action='store_true',
+            help='Write the results as the new baseline'
+        )
+        parser.add_argument(
+            '--serving', action='store_true',
+            help='Compare the throughput of the read endpoints served by '
+                 'sync views (WSGI) and async views (ASGI) instead'
+        )
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument(
+            '--requests', type=int, default=500,
+            help='Requests per serving mode'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError('--sizes must be numbers')
+        results = {}
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True
+        )
+        try:
+            for size in sizes:
+                if size != sizes[0]:
+                    call_command('flush', interactive=False, verbosity=0)
+                if options['serving']:
+                    self.report_serving(size, compare_serving(
+                        size, options['concurrency'], options['requests']
+                    ))
+                    continue
+                results[str(size)] = run_benchmarks(
+                    size, options['repeat'], options['endpoint']
+                )
+                self.report(size, results[str(size)])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        if options['serving']:
+            return
+        if options['update_baseline']:
+            with open(options['baseline'], 'w') as file:
+                json.dump(results, file, indent=2, sort_keys=True)
+                file.write('\n')
+            self.stdout.write(f'Baseline written to {options["baseline"]}')
+            return
+        if not os.path.exists(options['baseline']):
+            self.stdout.write('No baseline to compare with')
+            return
+        with open(options['baseline']) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, options['threshold'])
+        if regressions:
+            raise CommandError(
+                'Regressions against the baseline:\n' + '\n'.join(regressions)
+            )
+        self.stdout.write(self.style.SUCCESS('No regressions'))
+
+    def report(self, size, results):
+        self.stdout.write(f'{size} recipes')
+        for name, result in results.items():
+            self.stdout.write(
+                f'  {name:<26} p50 {result["p50_ms"]:>8.2f} ms  '
+                f'p95 {result["p95_ms"]:>8.2f} ms  '
+                f'{result["queries"]:>3} queries  '
+                f'{result["peak_kb"]:>6} KB'
+            )
+
+    def report_serving(self, size, results):
+        self.stdout.write(f'{size} recipes')
+        for mode, result in results.items():
+            self.stdout.write(
+                f'  {mode:<5} {result["requests_per_s"]:>8.1f} req/s  '
+                f'{result["requests_per_cpu_s"]:>8.1f} req/cpu-s  '
+                f'p50 {result["p50_ms"]:>8.2f} ms  '
+                f'p95 {result["p95_ms"]:>8.2f} ms'
+            )
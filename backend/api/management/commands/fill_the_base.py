@@ -1,24 +1,58 @@
-import csv
 import os
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
-from recipe.models import Ingredients
+from django.core.management.base import BaseCommand, CommandError
+
+from api.ingredients_import import (CHUNK_SIZE, IMPORT_FORMATS, guess_format,
+                                    import_ingredients,
+                                    merge_duplicate_ingredients)
 
 BASE_DIR = settings.BASE_DIR
-batch_size = 1000
 
 
 class Command(BaseCommand):
     help = 'Fill the base'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?',
+            default=os.path.join(BASE_DIR, 'data/ingredients.csv'),
+            help='CSV, JSON or JSONL file with ingredients'
+        )
+        parser.add_argument(
+            '--format', choices=IMPORT_FORMATS,
+            help='File format, guessed from the extension by default'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=CHUNK_SIZE,
+            help='Rows per transaction'
+        )
+        parser.add_argument(
+            '--merge-duplicates', action='store_true',
+            help='Merge duplicate ingredients left by earlier imports'
+        )
+
     def handle(self, *args, **options):
-        bulk_list = []
-
-        with open(os.path.join(BASE_DIR, 'data/ingredients.csv')) as f:
-            reader = csv.reader(f)
-            for row in reader:
-                ingredient = Ingredients(name=row[0], measurement_unit=row[1])
-                bulk_list.append(ingredient)
-                # ingredient.save()
-        Ingredients.objects.bulk_create(bulk_list, batch_size)
+        if options['merge_duplicates']:
+            merged = merge_duplicate_ingredients()
+            self.stdout.write(f'{merged} duplicate ingredients merged')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+        path = options['path']
+        file_format = options['format'] or guess_format(path)
+        with open(path, encoding='utf-8') as file:
+            stats = import_ingredients(
+                file, file_format, options['chunk_size'],
+                progress=self.report
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'{stats["read"]} rows read, {stats["created"]} ingredients '
+            f'created, {stats["skipped"]} skipped in {stats["seconds"]}s'
+        ))
+
+    def report(self, stats):
+        rate = stats['read'] / stats['seconds'] if stats['seconds'] else 0
+        self.stdout.write(
+            f'{stats["read"]} rows read, {stats["created"]} created, '
+            f'{stats["seconds"]}s ({rate:.0f} rows/s)'
+        )
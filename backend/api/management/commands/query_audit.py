@@ -0,0 +1,85 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (setup_test_environment,
+                               teardown_test_environment)
+
+from api.benchmarks import ENDPOINTS, seed
+from api.query_audit import MIN_ROWS, audit_data, audit_endpoint, table_sizes
+from users.models import User
+
+SQL_PREVIEW = 160
+
+
+class Command(BaseCommand):
+    help = (
+        'Explain the queries every API endpoint issues and flag sequential '
+        'scans and sorts on large tables'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--endpoint', action='append', choices=sorted(ENDPOINTS),
+            help='Only these endpoints, may be repeated'
+        )
+        parser.add_argument(
+            '--user', help='Email of the user to send requests as'
+        )
+        parser.add_argument(
+            '--min-rows', type=int, default=MIN_ROWS,
+            help='Tables with fewer rows are not flagged'
+        )
+        parser.add_argument(
+            '--seed', type=int, metavar='RECIPES',
+            help='Audit a throwaway test database seeded with this many '
+                 'recipes instead of the configured one'
+        )
+        parser.add_argument(
+            '--fail', action='store_true',
+            help='Exit with an error when anything is flagged'
+        )
+
+    def handle(self, *args, **options):
+        if options['seed'] is None:
+            self.audit(options)
+            return
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True
+        )
+        try:
+            seed(options['seed'])
+            self.audit(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def audit(self, options):
+        try:
+            data = audit_data(options['user'])
+        except (User.DoesNotExist, ValueError) as error:
+            raise CommandError(f'No user to audit with: {error}')
+        sizes = table_sizes()
+        flagged = 0
+        for name in options['endpoint'] or ENDPOINTS:
+            result = audit_endpoint(name, data, sizes, options['min_rows'])
+            self.stdout.write(
+                f'{name}: {result["status"]}, {result["queries"]} queries'
+            )
+            for query in result['explained']:
+                if not query['findings'] and options['verbosity'] < 2:
+                    continue
+                flagged += bool(query['findings'])
+                style = (
+                    self.style.WARNING if query['findings']
+                    else self.style.SUCCESS
+                )
+                self.stdout.write(style(
+                    f'  {query["ms"]:.1f} ms '
+                    f'{", ".join(query["findings"]) or "ok"}'
+                ))
+                self.stdout.write(f'    {query["sql"][:SQL_PREVIEW]}')
+                if options['verbosity'] >= 3:
+                    self.stdout.write(query['plan'])
+        if flagged and options['fail']:
+            raise CommandError(f'{flagged} queries flagged')
+        self.stdout.write(f'{flagged} queries flagged')
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from recipe.signals import COUNTERS, actual_count, recount
+
+# Drifted rows repaired per UPDATE.
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Recompute denormalized counters and repair drift'
+
+    def handle(self, *args, **options):
+        for model, field, owner_field, owner in COUNTERS:
+            with transaction.atomic():
+                # Only the drifted rows are written and locked, so the
+                # F() updates of other rows go on during the run.
+                pks = list(owner.objects.annotate(
+                    actual=actual_count(model, owner_field)
+                ).exclude(**{field: F('actual')}).values_list(
+                    'pk', flat=True
+                ))
+                for start in range(0, len(pks), BATCH_SIZE):
+                    recount(
+                        model, field, owner_field, owner,
+                        pks[start:start + BATCH_SIZE]
+                    )
+                drifted = len(pks)
+            self.stdout.write(
+                f'{owner.__name__}.{field}: {drifted} rows repaired'
+            )
@@ -0,0 +1,63 @@
+import multiprocessing
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from api.jobs import run_workers
+
+
+class Command(BaseCommand):
+    help = 'Run background jobs from the queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads', type=int, default=settings.JOB_WORKER_THREADS,
+            help='Worker threads per process'
+        )
+        parser.add_argument(
+            '--processes', type=int,
+            default=settings.JOB_WORKER_PROCESSES,
+            help='Worker processes'
+        )
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='Exit once the queue is empty'
+        )
+
+    def handle(self, *args, **options):
+        threads, processes = options['threads'], options['processes']
+        if threads < 1 or processes < 1:
+            raise CommandError('--threads and --processes must be positive')
+        self.stdout.write(
+            f'Running {processes} x {threads} workers'
+        )
+        if processes == 1:
+            self.run(threads, options['burst'])
+            return
+        # Connections must not be shared with the forked children.
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        children = [
+            context.Process(target=self.run, args=(threads, options['burst']))
+            for _ in range(processes)
+        ]
+        for child in children:
+            child.start()
+        try:
+            for child in children:
+                child.join()
+        except KeyboardInterrupt:
+            for child in children:
+                child.terminate()
+
+    def run(self, threads, burst):
+        stop = threading.Event()
+        # Running jobs are finished before exiting.
+        signal.signal(signal.SIGTERM, lambda *args: stop.set())
+        try:
+            run_workers(threads, stop=stop, burst=burst)
+        except KeyboardInterrupt:
+            stop.set()
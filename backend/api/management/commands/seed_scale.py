@@ -0,0 +1,97 @@
+import io
+import time
+from datetime import datetime, timezone
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from api.seed_scale import SEED_EPOCH, ScaleSeeder
+from recipe.search import rebuild_search_index
+
+
+def epoch(value):
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate a large synthetic dataset with power law popularity, '
+        'the same seed always gives the same data'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000)
+        parser.add_argument('--recipes', type=int, default=1000000)
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, default=8,
+            help='Average number of ingredients in a recipe'
+        )
+        parser.add_argument('--favorites', type=int, default=3000000)
+        parser.add_argument('--cart', type=int, default=500000)
+        parser.add_argument('--follows', type=int, default=1000000)
+        parser.add_argument(
+            '--popularity-alpha', type=float, default=1.1,
+            help='Power law exponent of recipe favorites and carts'
+        )
+        parser.add_argument(
+            '--activity-alpha', type=float, default=0.8,
+            help='Power law exponent of user activity and authorship'
+        )
+        parser.add_argument(
+            '--followers-alpha', type=float, default=1.2,
+            help='Power law exponent of followers per user'
+        )
+        parser.add_argument(
+            '--ingredients-alpha', type=float, default=1.0,
+            help='Power law exponent of ingredient use'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--epoch', type=epoch, default=SEED_EPOCH,
+            help='ISO date the recipes are published back from, '
+                 f'{SEED_EPOCH.date()} by default'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=10000,
+            help='Rows per transaction'
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+        if options['users'] < 2 or options['recipes'] < 1:
+            raise CommandError('At least 2 users and 1 recipe are needed')
+        started = time.monotonic()
+        seeder = ScaleSeeder(
+            options['seed'], options['chunk_size'], progress=self.report,
+            epoch=options['epoch']
+        )
+        seeder.seed_reference_data()
+        seeder.seed_users(options['users'])
+        seeder.seed_recipes(options['recipes'], options['activity_alpha'])
+        seeder.seed_recipe_ingredients(
+            options['ingredients_per_recipe'], options['ingredients_alpha']
+        )
+        seeder.seed_memberships(
+            options['favorites'], options['cart'], options['follows'],
+            options['popularity_alpha'], options['activity_alpha'],
+            options['followers_alpha']
+        )
+        # Bulk writes skip the signals, so counters, the search index and
+        # every cache are rebuilt at the end.
+        call_command('recount', stdout=io.StringIO())
+        rebuild_search_index()
+        cache.clear()
+        self.stdout.write(self.style.SUCCESS(
+            f'Done in {time.monotonic() - started:.1f}s'
+        ))
+
+    def report(self, table, rows, seconds):
+        rate = rows / seconds if seconds else 0
+        self.stdout.write(
+            f'{table}: {rows} rows in {seconds:.1f}s ({rate:.0f} rows/s)'
+        )
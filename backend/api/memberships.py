@@ -0,0 +1,79 @@
+from array import array
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from recipe.models import Favorite, ShoppingCart
+from users.models import Follow
+
+from .db_router import primary
+
+MEMBERSHIP_KEY = 'memberships:{user_id}:{kind}'
+# kind: (model, id of the member)
+MEMBERSHIP_KINDS = {
+    'favorites': (Favorite, 'recipe_id'),
+    'cart': (ShoppingCart, 'recipe_id'),
+    'follows': (Follow, 'following_id'),
+}
+
+
+def load_members(user_id, kind, replace=False):
+    model, field = MEMBERSHIP_KINDS[kind]
+    with primary():
+        members = array('q', sorted(model.objects.filter(
+            user_id=user_id
+        ).values_list(field, flat=True)))
+    # Stored as packed 8 byte ids, a few KB even for heavy users. Reads
+    # only add: a set loaded before a write must not overwrite the one
+    # refresh_members stores after its commit.
+    (cache.set if replace else cache.add)(
+        MEMBERSHIP_KEY.format(user_id=user_id, kind=kind),
+        members.tobytes(),
+        settings.MEMBERSHIP_CACHE_TIMEOUT
+    )
+    return frozenset(members)
+
+
+def get_members(user_id, kind):
+    packed = cache.get(MEMBERSHIP_KEY.format(user_id=user_id, kind=kind))
+    if packed is None:
+        return load_members(user_id, kind)
+    members = array('q')
+    members.frombytes(packed)
+    return frozenset(members)
+
+
+def refresh_members(user_id, kind):
+    # Reloaded after commit, so other requests never see a set that
+    # contains a rolled back write.
+    transaction.on_commit(
+        lambda: load_members(user_id, kind, replace=True)
+    )
+
+
+class Memberships:
+    # Sets of the user's favorite recipes, cart recipes and followed
+    # authors, each loaded at most once per request.
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.loaded = {}
+
+    def __getitem__(self, kind):
+        if kind not in self.loaded:
+            self.loaded[kind] = get_members(self.user_id, kind)
+        return self.loaded[kind]
+
+    def contains(self, kind, member_id):
+        return member_id in self[kind]
+
+
+def request_memberships(request):
+    if request is None or not request.user.is_authenticated:
+        return None
+    memberships = getattr(request, '_memberships', None)
+    if memberships is None:
+        memberships = Memberships(request.user.id)
+        request._memberships = memberships
+    return memberships
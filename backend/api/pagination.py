@@ -1,4 +1,12 @@
+import json
+from base64 import b64decode, b64encode
+from binascii import Error as BinasciiError
+from datetime import datetime
+
+from django.db.models import Q
 from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class CustomPagination(pagination.PageNumberPagination):
@@ -6,4 +14,106 @@ class CustomPagination(pagination.PageNumberPagination):
 
 
 class CustomSubscriptionsPagination(pagination.PageNumberPagination):
-    page_size_query_param = 'recipes_limit'
+    # recipes_limit caps the nested recipes, not the page,
+    # see api/subscriptions.py
+    page_size_query_param = 'limit'
+
+
+class RecipesCursorPagination(pagination.CursorPagination):
+    # Keyset pagination on (pub_date, id): pages are fetched with
+    # WHERE (pub_date, id) < (last seen) instead of OFFSET, and there is
+    # no COUNT(*), so the cost of a page does not depend on its depth.
+    page_size_query_param = 'limit'
+    ordering = ('-pub_date', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        self.reverse = cursor is not None and cursor[2]
+        if cursor is None:
+            queryset = queryset.order_by('-pub_date', '-id')
+        elif self.reverse:
+            pub_date, pk, _ = cursor
+            queryset = queryset.filter(
+                Q(pub_date__gt=pub_date) | Q(pub_date=pub_date, id__gt=pk)
+            ).order_by('pub_date', 'id')
+        else:
+            pub_date, pk, _ = cursor
+            queryset = queryset.filter(
+                Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, id__lt=pk)
+            ).order_by('-pub_date', '-id')
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if self.reverse:
+            self.page.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = cursor is not None
+        return self.page
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            cursor = json.loads(b64decode(encoded.encode('ascii')))
+            return (
+                datetime.fromisoformat(cursor['d']),
+                int(cursor['i']),
+                bool(cursor.get('r')),
+            )
+        except (BinasciiError, UnicodeError, ValueError, TypeError,
+                KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, recipe, reverse):
+        cursor = {'d': recipe.pub_date.isoformat(), 'i': recipe.id}
+        if reverse:
+            cursor['r'] = 1
+        encoded = b64encode(json.dumps(cursor).encode()).decode('ascii')
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, encoded
+        )
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+
+class RecipesPagination(CustomPagination):
+    # Page numbers by default, keyset cursors with ?pagination=cursor
+    # or once a cursor is passed.
+    cursor_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if (
+            request.query_params.get('pagination') == 'cursor'
+            or RecipesCursorPagination.cursor_query_param
+            in request.query_params
+        ):
+            self.cursor_paginator = RecipesCursorPagination()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
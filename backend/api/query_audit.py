@@ -0,0 +1,165 @@
+import json
+import re
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipe.models import Ingredients, RecipeIngredients, Recipes
+from users.models import User
+
+from .benchmarks import ENDPOINTS, INGREDIENTS_PER_RECIPE
+
+# Tables with fewer rows are read whole, a scan or sort there is fine.
+MIN_ROWS = 10000
+EXPLAINED = ('SELECT', 'UPDATE', 'DELETE')
+# FROM "recipe_recipes" U0, JOIN "users_user" T3
+TABLE_ALIAS = re.compile(r'(?:FROM|JOIN) "(\w+)"(?: ([A-Z]\d+)\b)?')
+# Every request runs without caches, so it issues all its queries.
+NO_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+}
+
+
+def table_sizes():
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                "SELECT relname, reltuples FROM pg_class WHERE relkind = 'r'"
+            )
+            return {name: int(rows) for name, rows in cursor.fetchall()}
+        sizes = {}
+        for table in connection.introspection.table_names(cursor):
+            cursor.execute(
+                f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}'
+            )
+            sizes[table] = cursor.fetchone()[0]
+        return sizes
+
+
+def postgres_findings(node, sizes, min_rows, loops=1):
+    findings = []
+    loops *= node.get('Actual Loops', 1)
+    if node['Node Type'] == 'Seq Scan':
+        table = node['Relation Name']
+        if sizes.get(table, 0) >= min_rows:
+            findings.append(f'seq scan on {table} ({sizes[table]} rows)')
+    elif node['Node Type'] in ('Sort', 'Incremental Sort'):
+        child = node['Plans'][0]
+        rows = child.get('Actual Rows', child['Plan Rows']) * loops
+        if rows >= min_rows:
+            findings.append(
+                f'sort of {rows} rows ({node.get("Sort Method", "planned")})'
+            )
+    for child in node.get('Plans', ()):
+        findings.extend(postgres_findings(child, sizes, min_rows, loops))
+    return findings
+
+
+def explain_postgres(sql, sizes, min_rows):
+    # Only reads are run for real, a write would change the data the
+    # other queries see.
+    analyze = 'ANALYZE, BUFFERS, ' if sql.startswith('SELECT') else ''
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN ({analyze}FORMAT JSON) {sql}')
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return (
+        postgres_findings(plan[0]['Plan'], sizes, min_rows),
+        json.dumps(plan[0], indent=2)
+    )
+
+
+def explain_sqlite(sql, sizes, min_rows):
+    tables = {}
+    for table, alias in TABLE_ALIAS.findall(sql):
+        tables[table] = table
+        if alias:
+            tables[alias] = table
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        details = [row[3] for row in cursor.fetchall()]
+    findings = []
+    largest = max((sizes.get(table, 0) for table in tables.values()),
+                  default=0)
+    for detail in details:
+        words = detail.split()
+        # Index lookups read USING ... INDEX, FTS5 tables VIRTUAL TABLE.
+        if words[0] == 'SCAN' and not {'USING', 'VIRTUAL'} & set(words):
+            table = tables.get(words[1], words[1])
+            if sizes.get(table, 0) >= min_rows:
+                findings.append(
+                    f'seq scan on {table} ({sizes[table]} rows)'
+                )
+        elif detail.startswith('USE TEMP B-TREE') and largest >= min_rows:
+            findings.append(detail.lower())
+    return findings, '\n'.join(details)
+
+
+def explain(sql, sizes, min_rows=MIN_ROWS):
+    if connection.vendor == 'postgresql':
+        return explain_postgres(sql, sizes, min_rows)
+    if connection.vendor == 'sqlite':
+        return explain_sqlite(sql, sizes, min_rows)
+    raise NotImplementedError(
+        f'No query plans for {connection.vendor} databases'
+    )
+
+
+def audit_data(email=None):
+    # The arguments the endpoints of api/benchmarks.py need, taken from
+    # the database: the user and their latest recipe.
+    if email:
+        user = User.objects.get(email=email)
+    else:
+        latest = Recipes.objects.order_by('-pub_date', '-id').first()
+        user = latest.author if latest else User.objects.first()
+    if user is None:
+        raise ValueError('The database has no users')
+    recipe = Recipes.objects.filter(author=user).order_by(
+        '-pub_date', '-id'
+    ).first()
+    ingredients = list(RecipeIngredients.objects.filter(
+        recipe=recipe
+    ).values_list('related_ingredient_id', flat=True)[
+        :INGREDIENTS_PER_RECIPE
+    ]) if recipe else []
+    return {
+        'token': Token.objects.get_or_create(user=user)[0].key,
+        'recipe': recipe.id if recipe else 0,
+        'ingredients': ingredients or list(
+            Ingredients.objects.values_list('id', flat=True)[
+                :INGREDIENTS_PER_RECIPE
+            ]
+        ),
+    }
+
+
+def audit_endpoint(name, data, sizes, min_rows=MIN_ROWS):
+    # Runs the request and explains each distinct query it issued, all
+    # in one transaction that is rolled back.
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {data["token"]}')
+    queries = {}
+    with transaction.atomic(), override_settings(CACHES=NO_CACHE):
+        with CaptureQueriesContext(connection) as captured:
+            response = ENDPOINTS[name](client, data, 0)
+        for query in captured:
+            sql = query['sql']
+            if sql in queries or not sql.startswith(EXPLAINED):
+                continue
+            findings, plan = explain(sql, sizes, min_rows)
+            queries[sql] = {
+                'sql': sql,
+                'ms': float(query['time']) * 1000,
+                'findings': findings,
+                'plan': plan,
+            }
+        transaction.set_rollback(True)
+    return {
+        'status': response.status_code,
+        'queries': len(captured),
+        'explained': list(queries.values()),
+    }
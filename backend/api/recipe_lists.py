@@ -0,0 +1,47 @@
+from django.db import transaction
+
+from recipe.models import Favorite, Recipes, ShoppingCart
+from recipe.signals import recount
+
+from .bulk_load import delete_rows
+from .download_shopping_cart import bump_cart_version
+from .memberships import refresh_members
+
+# kind: (model, counter on Recipes), kinds as in api/memberships.py
+RECIPE_LISTS = {
+    'favorites': (Favorite, 'favorites_count'),
+    'cart': (ShoppingCart, 'shopping_cart_count'),
+}
+
+
+def recipe_list_changed(user_id, kind, recipe_ids):
+    # Both writes below skip the model signals, so the bookkeeping they
+    # would do is done here once for the whole batch.
+    model, field = RECIPE_LISTS[kind]
+    recount(model, field, 'recipe_id', Recipes, recipe_ids)
+    refresh_members(user_id, kind)
+    if kind == 'cart':
+        bump_cart_version(user_id)
+
+
+@transaction.atomic
+def add_recipes(user_id, kind, recipe_ids):
+    # Ids already on the list are skipped by the unique constraint, so
+    # adding is idempotent and safe against concurrent requests.
+    model, _ = RECIPE_LISTS[kind]
+    model.objects.bulk_create(
+        [model(user_id=user_id, recipe_id=pk) for pk in recipe_ids],
+        ignore_conflicts=True
+    )
+    recipe_list_changed(user_id, kind, recipe_ids)
+
+
+@transaction.atomic
+def remove_recipes(user_id, kind, recipe_ids):
+    model, _ = RECIPE_LISTS[kind]
+    deleted = delete_rows(
+        model.objects.filter(user_id=user_id, recipe_id__in=recipe_ids)
+    )
+    if deleted:
+        recipe_list_changed(user_id, kind, recipe_ids)
+    return deleted
@@ -0,0 +1,127 @@
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+
+from .db_router import primary
+
+RESPONSE_GENERATION_KEY = 'response_generation:{}'
+RESPONSE_KEY = 'response:{scope}:{digest}'
+RESPONSE_STATS_KEY = 'response_cache:{}'
+# Generations of the data behind the anonymous recipe responses:
+# 'recipes' for any recipe, 'recipe:<id>' for a single one and
+# 'recipe_refs' for the tags, ingredients and authors they embed.
+RECIPES = 'recipes'
+RECIPE = 'recipe:{}'
+RECIPE_REFS = 'recipe_refs'
+
+
+def get_generations(names):
+    keys = [RESPONSE_GENERATION_KEY.format(name) for name in names]
+    generations = cache.get_many(keys)
+    missing = {
+        key: uuid.uuid4().hex for key in keys if key not in generations
+    }
+    if missing:
+        cache.set_many(missing, timeout=None)
+        generations.update(missing)
+    return [generations[key] for key in keys]
+
+
+def bump_generations(*names):
+    # After commit: a response built from the old rows in the meantime
+    # is stored under the old generations and never served again.
+    def bump():
+        cache.set_many(
+            {
+                RESPONSE_GENERATION_KEY.format(name): uuid.uuid4().hex
+                for name in names
+            },
+            timeout=None
+        )
+    transaction.on_commit(bump)
+
+
+def bump_recipe_responses(*recipe_ids):
+    bump_generations(RECIPES, *(RECIPE.format(pk) for pk in recipe_ids))
+
+
+def bump_recipe_refs():
+    bump_generations(RECIPE_REFS)
+
+
+def count(name):
+    key = RESPONSE_STATS_KEY.format(name)
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
+
+
+def response_cache_stats():
+    stats = cache.get_many(
+        [RESPONSE_STATS_KEY.format('hits'),
+         RESPONSE_STATS_KEY.format('misses')]
+    )
+    hits = stats.get(RESPONSE_STATS_KEY.format('hits'), 0)
+    misses = stats.get(RESPONSE_STATS_KEY.format('misses'), 0)
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / (hits + misses), 4) if hits else 0,
+    }
+
+
+def response_key(request, scope, generations):
+    uri = request.build_absolute_uri()
+    digest = hashlib.sha256(
+        '\n'.join([uri, *get_generations(generations)]).encode()
+    ).hexdigest()
+    return RESPONSE_KEY.format(scope=scope, digest=digest)
+
+
+def get_cached_response(key):
+    cached = cache.get(key)
+    if cached is None:
+        count('misses')
+        return None
+    count('hits')
+    content, content_type = cached
+    response = HttpResponse(content, content_type=content_type)
+    response['X-Cache'] = 'HIT'
+    return response
+
+
+def store_response(key, response):
+    # response must be rendered.
+    if response.status_code == 200:
+        cache.set(
+            key,
+            (response.content, response['Content-Type']),
+            settings.RESPONSE_CACHE_TIMEOUT
+        )
+    response['X-Cache'] = 'MISS'
+    return response
+
+
+def cached_response(view, request, scope, generations, build):
+    # Only anonymous JSON responses are shared, every other request is
+    # passed through to build().
+    if (
+        request.method != 'GET'
+        or request.user.is_authenticated
+        or request.accepted_renderer.format != 'json'
+    ):
+        return build()
+    key = response_key(request, scope, generations)
+    response = get_cached_response(key)
+    if response is not None:
+        return response
+    with primary():
+        response = view.finalize_response(request, build())
+    response.render()
+    return store_response(key, response)
@@ -0,0 +1,214 @@
+import os
+import random
+import time
+from array import array
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+
+from django.conf import settings
+from django.db import transaction
+
+from recipe.models import (Favorite, Ingredients, RecipeIngredients, Recipes,
+                           ShoppingCart, Tags)
+from users.models import Follow, User
+
+from .bulk_load import drop_staging_table, insert_rows
+from .ingredients_import import chunked, import_ingredients
+
+SEED_TAGS = (
+    ('Breakfast', '#E26C2D', 'breakfast'),
+    ('Lunch', '#49B64E', 'lunch'),
+    ('Dinner', '#8775D2', 'dinner'),
+    ('Dessert', '#C2185B', 'dessert'),
+    ('Vegan', '#2E7D32', 'vegan'),
+    ('Quick', '#F9A825', 'quick'),
+)
+FIRST_NAMES = (
+    'Анна', 'Иван', 'Мария', 'Пётр', 'Ольга', 'Сергей', 'Елена', 'Дмитрий',
+)
+LAST_NAMES = (
+    'Иванова', 'Петров', 'Смирнова', 'Кузнецов', 'Попова', 'Соколов',
+)
+DISHES = (
+    'Суп', 'Салат', 'Пирог', 'Рагу', 'Каша', 'Запеканка', 'Паста',
+    'Омлет', 'Котлеты', 'Соус',
+)
+# Recipes are published over this many days back from the epoch, a
+# fixed date so that the same seed gives the same timestamps.
+PUBLISHED_DAYS = 2 * 365
+SEED_EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+class PowerLaw:
+    # Draws ids with probability proportional to 1 / rank ** alpha. The
+    # ranks are shuffled, so popularity does not follow id order.
+
+    def __init__(self, ids, alpha, rng):
+        self.ids = array('q', ids)
+        rng.shuffle(self.ids)
+        self.cum_weights = array('d', accumulate(
+            1 / rank ** alpha for rank in range(1, len(self.ids) + 1)
+        ))
+        self.rng = rng
+
+    def sample(self, count):
+        return self.rng.choices(
+            self.ids, cum_weights=self.cum_weights, k=count
+        )
+
+
+class ScaleSeeder:
+    # Generates every table in chunks from one random seed, so the same
+    # options always produce the same rows.
+
+    def __init__(self, seed=0, chunk_size=10000, progress=None,
+                 epoch=SEED_EPOCH):
+        self.rng = random.Random(seed)
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.epoch = epoch
+
+    def load(self, model, fields, rows):
+        started = time.monotonic()
+        total = 0
+        for chunk in chunked(rows, self.chunk_size):
+            with transaction.atomic():
+                insert_rows(model, fields, chunk)
+            total += len(chunk)
+        drop_staging_table(model)
+        if self.progress is not None:
+            self.progress(
+                model._meta.verbose_name_plural, total,
+                time.monotonic() - started
+            )
+
+    def new_ids(self, model, after):
+        return array('q', model.objects.filter(id__gt=after).order_by(
+            'id'
+        ).values_list('id', flat=True).iterator())
+
+    def last_id(self, model):
+        return model.objects.order_by('-id').values_list(
+            'id', flat=True
+        ).first() or 0
+
+    def seed_reference_data(self):
+        with open(
+            os.path.join(settings.BASE_DIR, 'data/ingredients.csv'),
+            encoding='utf-8'
+        ) as file:
+            import_ingredients(file)
+        for name, color, slug in SEED_TAGS:
+            Tags.objects.get_or_create(
+                slug=slug, defaults={'name': name, 'color': color}
+            )
+        self.ingredients = dict(
+            Ingredients.objects.values_list('id', 'measurement_unit')
+        )
+        self.tag_ids = list(Tags.objects.values_list('id', flat=True))
+
+    def seed_users(self, count):
+        after = self.last_id(User)
+        # Continues the numbering, so running the command again adds
+        # new users instead of clashing with the unique fields.
+        start = User.objects.filter(username__startswith='seed').count()
+        self.load(User, (
+            'password', 'username', 'email', 'first_name', 'last_name',
+            'is_subscribed', 'is_staff', 'is_active', 'is_superuser',
+            'recipes_count', 'followers_count',
+        ), (
+            (
+                '!', f'seed{number}', f'seed{number}@example.com',
+                self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES),
+                False, False, True, False, 0, 0,
+            )
+            for number in range(start, start + count)
+        ))
+        self.user_ids = self.new_ids(User, after)
+
+    def seed_recipes(self, count, author_alpha):
+        after = self.last_id(Recipes)
+        authors = PowerLaw(self.user_ids, author_alpha, self.rng)
+        names = list(Ingredients.objects.order_by('id').values_list(
+            'name', flat=True
+        )[:500])
+
+        def rows():
+            for chunk in chunked(range(count), self.chunk_size):
+                for author_id in authors.sample(len(chunk)):
+                    main = self.rng.choice(names)
+                    yield (
+                        f'{self.rng.choice(DISHES)}: {main}', '',
+                        f'{self.rng.choice(DISHES)} с ингредиентом {main}',
+                        self.rng.randint(1, 180), author_id, False, False,
+                        self.epoch - timedelta(
+                            seconds=self.rng.randint(
+                                0, PUBLISHED_DAYS * 24 * 60 * 60
+                            )
+                        ),
+                        0, 0,
+                    )
+
+        self.load(Recipes, (
+            'name', 'image', 'text', 'cooking_time', 'author',
+            'is_favorited', 'is_in_shopping_cart', 'pub_date',
+            'favorites_count', 'shopping_cart_count',
+        ), rows())
+        self.recipe_ids = self.new_ids(Recipes, after)
+
+    def seed_recipe_ingredients(self, per_recipe, alpha):
+        # Common ingredients like salt are drawn far more often.
+        ingredients = PowerLaw(list(self.ingredients), alpha, self.rng)
+        low, high = max(per_recipe // 2, 1), max(per_recipe * 3 // 2, 1)
+
+        def rows():
+            for recipe_id in self.recipe_ids:
+                for ingredient_id in set(
+                    ingredients.sample(self.rng.randint(low, high))
+                ):
+                    yield (
+                        recipe_id, ingredient_id, self.rng.randint(1, 500),
+                        self.ingredients[ingredient_id],
+                    )
+
+        self.load(RecipeIngredients, (
+            'recipe', 'related_ingredient', 'quantity', 'measurement_unit',
+        ), rows())
+        through = Recipes.tags.through
+        self.load(through, ('recipes', 'tags'), (
+            (recipe_id, tag_id)
+            for recipe_id in self.recipe_ids
+            for tag_id in self.rng.sample(
+                self.tag_ids, self.rng.randint(1, min(3, len(self.tag_ids)))
+            )
+        ))
+
+    def pairs(self, count, users, targets, exclude_self=False):
+        # (user, target) pairs without repeats inside a chunk, repeats
+        # across chunks are skipped by the unique constraints.
+        for chunk in chunked(range(count), self.chunk_size):
+            seen = set()
+            for pair in zip(users.sample(len(chunk)),
+                            targets.sample(len(chunk))):
+                if pair in seen or exclude_self and pair[0] == pair[1]:
+                    continue
+                seen.add(pair)
+                yield pair
+
+    def seed_memberships(self, favorites, carts, follows, popularity_alpha,
+                         activity_alpha, follower_alpha):
+        users = PowerLaw(self.user_ids, activity_alpha, self.rng)
+        recipes = PowerLaw(self.recipe_ids, popularity_alpha, self.rng)
+        self.load(
+            Favorite, ('user', 'recipe'),
+            self.pairs(favorites, users, recipes)
+        )
+        self.load(
+            ShoppingCart, ('user', 'recipe'),
+            self.pairs(carts, users, recipes)
+        )
+        followed = PowerLaw(self.user_ids, follower_alpha, self.rng)
+        self.load(
+            Follow, ('user', 'following'),
+            self.pairs(follows, users, followed, exclude_self=True)
+        )
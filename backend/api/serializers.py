@@ -1,14 +1,22 @@
-import base64
 from users.models import Follow, User
+from api.models import Job
 from recipe.models import (
-    Ingredients, RecipeIngredients, Recipes, Tags, Favorite, ShoppingCart
+    Ingredients, RecipeIngredients, Recipes, Tags
 )
 
 import webcolors
-from django.core.files.base import ContentFile
 from djoser.serializers import SetPasswordSerializer, UserCreateSerializer
 from rest_framework import serializers
-from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
+
+from .bulk_load import delete_pks
+from .cook_index import recipes_changed
+from .download_shopping_cart import bump_recipe_carts
+from .images import ingest_data_uri
+from .memberships import request_memberships
+from .response_cache import bump_recipe_responses
+from .subscriptions import get_recipes_limit
 
 
 class Name2Hex(serializers.Field):
@@ -26,9 +34,15 @@ class Name2Hex(serializers.Field):
 class Picture2Text(serializers.ImageField):
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            image = ingest_data_uri(data)
+            # Files are named by content hash, identical uploads share
+            # the stored file.
+            model_field = self.parent.Meta.model._meta.get_field(self.source)
+            name = model_field.generate_filename(None, image.name)
+            if model_field.storage.exists(name):
+                image.close()
+                return name
+            return image
 
         return super().to_internal_value(data)
 
@@ -80,13 +94,11 @@ class UserSerializer(serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
     def get_is_subscribed(self, obj):
-        user = User.objects.get(id=obj.id)
-        print(user)
-        try:
-            Follow.objects.filter(user=user)
-            return True
-        except ObjectDoesNotExist:
-            return False
+        memberships = request_memberships(self.context.get('request'))
+        return (
+            memberships is not None
+            and memberships.contains('follows', obj.id)
+        )
 
     class Meta:
         model = User
@@ -174,6 +186,14 @@ class TagWithinRecipeSerializer(serializers.ModelSerializer):
 
 
 class UserRecipeSerializer(serializers.ModelSerializer):
+    is_subscribed = serializers.SerializerMethodField()
+
+    def get_is_subscribed(self, obj):
+        memberships = request_memberships(self.context.get('request'))
+        return (
+            memberships is not None
+            and memberships.contains('follows', obj.id)
+        )
 
     class Meta:
         fields = (
@@ -228,6 +248,27 @@ class IngredientsPostSerializer(serializers.ModelSerializer):
         model = Ingredients
 
 
+def recipe_ingredients_prefetch():
+    return Prefetch(
+        'recipe_with_ing',
+        queryset=RecipeIngredients.objects.select_related(
+            'related_ingredient'
+        )
+    )
+
+
+def delete_recipe_ingredients(recipe_id, recipe_ingredients):
+    # One DELETE of rows the caller has loaded, instead of a query per
+    # row for the post_delete signals, whose bookkeeping is done here.
+    bump_recipe_carts(recipe_id)
+    deleted = delete_pks(
+        RecipeIngredients, [row.pk for row in recipe_ingredients]
+    )
+    recipes_changed(recipe_id)
+    bump_recipe_responses(recipe_id)
+    return deleted
+
+
 class RecipesPostSerializer(serializers.ModelSerializer):
     tags = serializers.PrimaryKeyRelatedField(
         queryset=Tags.objects.all(), many=True
@@ -246,42 +287,71 @@ class RecipesPostSerializer(serializers.ModelSerializer):
             'cooking_time',
         )
 
+    @transaction.atomic
     def create(self, validated_data):
         author = self.context['request'].user
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
         new_recipe = Recipes.objects.create(author=author, **validated_data)
-        new_recipe.save()
-
-        for ingredient in ingredients:
-            ingredient_obj = Ingredients.objects.get(id=ingredient['id'])
-            RecipeIngredients.objects.create(
+        RecipeIngredients.objects.bulk_create(
+            RecipeIngredients(
                 recipe=new_recipe,
-                related_ingredient=ingredient_obj,
+                related_ingredient_id=ingredient['id'],
                 quantity=ingredient['amount']
             )
-            ingredient_obj.save()
-            new_recipe.ingredients.add(ingredient_obj)
-
+            for ingredient in ingredients
+        )
         new_recipe.tags.set(tags)
+        recipes_changed(new_recipe.id)
         return new_recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients = validated_data.get('ingredients')
-        tags = validated_data.get('tags')
-        instance.ingredients.clear()
-        instance.tags.clear()
-        for ingredient in ingredients:
-            ingredient, created = Ingredients.objects.get_or_create(
-                id=ingredient['id']
-            )
-            instance.ingredients.add(ingredient)
-        for tag in tags:
-            tag = Tags.objects.get(id=tag.id)
-            instance.tags.add(tag)
-        instance.save()
+        ingredients = validated_data.pop('ingredients', None)
+        tags = validated_data.pop('tags', None)
+        instance = super().update(instance, validated_data)
+        if tags is not None:
+            # set() only writes the difference
+            instance.tags.set(tags)
+        if ingredients is not None:
+            self.update_ingredients(instance, ingredients)
         return instance
 
+    def update_ingredients(self, instance, ingredients):
+        amounts = {item['id']: item['amount'] for item in ingredients}
+        current = {
+            recipe_ingredient.related_ingredient_id: recipe_ingredient
+            for recipe_ingredient in instance.recipe_with_ing.all()
+        }
+        removed = current.keys() - amounts.keys()
+        if removed:
+            delete_recipe_ingredients(
+                instance.id, [current[pk] for pk in removed]
+            )
+        changed = []
+        for ingredient_id, recipe_ingredient in current.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and recipe_ingredient.quantity != amount:
+                recipe_ingredient.quantity = amount
+                changed.append(recipe_ingredient)
+        if changed:
+            RecipeIngredients.objects.bulk_update(changed, ['quantity'])
+        added = amounts.keys() - current.keys()
+        if added:
+            RecipeIngredients.objects.bulk_create(
+                RecipeIngredients(
+                    recipe=instance,
+                    related_ingredient_id=ingredient_id,
+                    quantity=amounts[ingredient_id]
+                )
+                for ingredient_id in added
+            )
+        if changed or added:
+            # Bulk writes send no signals, refresh cached shopping lists.
+            transaction.on_commit(lambda: bump_recipe_carts(instance.id))
+        if removed or added:
+            recipes_changed(instance.id)
+
     def validate_ingredients(self, data):
         ingredients = []
         for item in data:
@@ -295,9 +365,18 @@ class RecipesPostSerializer(serializers.ModelSerializer):
                 'Some ingredients are duplicated. '
                 'Please check your data'
             )
+        missing = set(ingredients) - set(
+            Ingredients.objects.in_bulk(ingredients)
+        )
+        if missing:
+            raise serializers.ValidationError(
+                'No such ingredients: '
+                + ', '.join(str(pk) for pk in sorted(missing))
+            )
         return data
 
     def to_representation(self, obj):
+        prefetch_related_objects([obj], 'tags', recipe_ingredients_prefetch())
         return RecipesSerializer(
             obj, context={'request': self.context['request']}
         ).data
@@ -314,24 +393,20 @@ class RecipesSerializer(serializers.ModelSerializer):
     is_in_shopping_cart = serializers.SerializerMethodField()
 
     def get_is_favorited(self, obj):
-        request = self.context.get('request', None)
-        if request.user.is_authenticated:
-            try:
-                Favorite.objects.get(recipe=obj, user=request.user)
-                return True
-            except ObjectDoesNotExist:
-                return False
-        return False
+        # Set lookups against the user's cached memberships,
+        # see api/memberships.py
+        memberships = request_memberships(self.context.get('request'))
+        return (
+            memberships is not None
+            and memberships.contains('favorites', obj.id)
+        )
 
     def get_is_in_shopping_cart(self, obj):
-        request = self.context.get('request', None)
-        if request.user.is_authenticated:
-            try:
-                ShoppingCart.objects.get(recipe=obj, user=request.user)
-                return True
-            except ObjectDoesNotExist:
-                return False
-        return False
+        memberships = request_memberships(self.context.get('request'))
+        return (
+            memberships is not None
+            and memberships.contains('cart', obj.id)
+        )
 
     class Meta:
         model = Recipes
@@ -355,6 +430,16 @@ class RecipesSerializer(serializers.ModelSerializer):
         return representation
 
 
+class CookRecipesSerializer(RecipesSerializer):
+    coverage = serializers.FloatField(read_only=True)
+    missing_ingredients = serializers.IntegerField(read_only=True)
+
+    class Meta(RecipesSerializer.Meta):
+        fields = RecipesSerializer.Meta.fields + (
+            'coverage', 'missing_ingredients'
+        )
+
+
 class RecipesSerializerRestricted(serializers.ModelSerializer):
 
     class Meta:
@@ -369,27 +454,26 @@ class RecipesSerializerRestricted(serializers.ModelSerializer):
 
 class UserFollowSerializer(serializers.ModelSerializer):
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.IntegerField(read_only=True)
     is_subscribed = serializers.SerializerMethodField()
 
-    def get_recipes_count(self, obj):
-        following_user = User.objects.get(id=obj.id)
-        recipes_obj = Recipes.objects.filter(author_id=following_user.id)
-        return recipes_obj.count()
-
     def get_recipes(self, obj):
-        following_user = User.objects.get(id=obj.id)
-        recipes_obj = Recipes.objects.filter(author_id=following_user.id)[:3]
-        return RecipesSerializerRestricted(recipes_obj, many=True).data
+        # AllFollowingView prefetches latest_recipes, other callers
+        # fall back to a query.
+        recipes_obj = getattr(obj, 'latest_recipes', None)
+        if recipes_obj is None:
+            limit = get_recipes_limit(self.context.get('request'))
+            recipes_obj = obj.recipes_set.all()[:limit]
+        return RecipesSerializerRestricted(
+            recipes_obj, many=True, context=self.context
+        ).data
 
     def get_is_subscribed(self, obj):
-        user = User.objects.get(id=obj.id)
-        print(user)
-        try:
-            Follow.objects.filter(user=user)
-            return True
-        except ObjectDoesNotExist:
-            return False
+        memberships = request_memberships(self.context.get('request'))
+        return (
+            memberships is not None
+            and memberships.contains('follows', obj.id)
+        )
 
     class Meta:
         model = User
@@ -422,13 +506,11 @@ class AllSubscriptionsSerializer(serializers.ModelSerializer):
         return RecipesSerializerRestricted(recipes_obj, many=True).data
 
     def get_is_subscribed(self, obj):
-        user = User.objects.get(id=obj.id)
-        print(user)
-        try:
-            Follow.objects.filter(user=user)
-            return True
-        except ObjectDoesNotExist:
-            return False
+        memberships = request_memberships(self.context.get('request'))
+        return (
+            memberships is not None
+            and memberships.contains('follows', obj.id)
+        )
 
     class Meta:
         model = User
@@ -455,3 +537,37 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
     class Meta:
         model = Recipes
         fields = ('id', 'name', 'image', 'cooking_time')
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=500
+    )
+
+    def validate_recipes(self, value):
+        recipe_ids = list(dict.fromkeys(value))
+        recipes = Recipes.objects.in_bulk(recipe_ids)
+        missing = [pk for pk in recipe_ids if pk not in recipes]
+        if missing:
+            raise serializers.ValidationError(
+                f'Recipes do not exist: {missing}'
+            )
+        return [recipes[pk] for pk in recipe_ids]
+
+
+class JobSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = Job
+        fields = (
+            'id',
+            'name',
+            'status',
+            'attempts',
+            'result',
+            'created_at',
+            'started_at',
+            'finished_at',
+        )
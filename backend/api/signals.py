@@ -0,0 +1,80 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from recipe.models import (Favorite, Ingredients, RecipeIngredients, Recipes,
+                           ShoppingCart, Tags)
+from users.models import Follow, User
+
+from .cook_index import recipes_changed
+from .download_shopping_cart import (bump_cart_version, bump_catalogue_version,
+                                     bump_recipe_carts)
+from .ingredients_index import invalidate_ingredients_index
+from .memberships import refresh_members
+from .response_cache import bump_recipe_refs, bump_recipe_responses
+from .serializers import UserRecipeSerializer
+from .snapshots import bump_snapshot
+
+AUTHOR_FIELDS = set(UserRecipeSerializer.Meta.fields)
+
+
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def shopping_cart_changed(sender, instance, **kwargs):
+    bump_cart_version(instance.user_id)
+    refresh_members(instance.user_id, 'cart')
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+def favorite_changed(sender, instance, **kwargs):
+    refresh_members(instance.user_id, 'favorites')
+
+
+@receiver((post_save, post_delete), sender=Follow)
+def follow_changed(sender, instance, **kwargs):
+    refresh_members(instance.user_id, 'follows')
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredients)
+def recipe_ingredients_changed(sender, instance, **kwargs):
+    bump_recipe_carts(instance.recipe_id)
+    recipes_changed(instance.recipe_id)
+    bump_recipe_responses(instance.recipe_id)
+
+
+@receiver((post_save, post_delete), sender=Recipes)
+def recipe_changed(sender, instance, **kwargs):
+    bump_recipe_responses(instance.id)
+
+
+@receiver(m2m_changed, sender=Recipes.tags.through)
+def recipe_tags_changed(sender, instance, action, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if isinstance(instance, Recipes):
+        bump_recipe_responses(instance.id)
+    else:
+        bump_recipe_responses(*(pk_set or ()))
+
+
+@receiver((post_save, post_delete), sender=Ingredients)
+def ingredients_changed(sender, instance, **kwargs):
+    bump_catalogue_version()
+    invalidate_ingredients_index()
+    bump_snapshot('ingredients')
+    bump_recipe_refs()
+
+
+@receiver((post_save, post_delete), sender=Tags)
+def tags_changed(sender, instance, **kwargs):
+    bump_snapshot('tags')
+    bump_recipe_refs()
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created, update_fields=None, **kwargs):
+    # Only the fields recipes show of their author matter, and only for
+    # users with recipes: registrations and logins change nothing. A
+    # deleted user's recipes are deleted and bump on their own.
+    if created or update_fields and not AUTHOR_FIELDS & set(update_fields):
+        return
+    if Recipes.objects.filter(author=instance).exists():
+        bump_recipe_refs()
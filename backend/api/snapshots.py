@@ -0,0 +1,106 @@
+import gzip
+import hashlib
+import threading
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import parse_etags, patch_vary_headers
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from .db_router import primary
+
+SNAPSHOT_GENERATION_KEY = 'snapshot_generation:{}'
+SNAPSHOT_KEY = 'snapshot:{name}:{generation}'
+# Content-Encoding values in order of preference.
+ENCODINGS = ('br', 'gzip')
+
+
+def build_snapshot(data):
+    content = JSONRenderer().render(data)
+    snapshot = {
+        'etag': f'W/"{hashlib.sha256(content).hexdigest()}"',
+        'identity': content,
+        'gzip': gzip.compress(content, compresslevel=9),
+    }
+    if brotli is not None:
+        snapshot['br'] = brotli.compress(content)
+    return snapshot
+
+
+class SnapshotStore:
+    # Snapshots are shared through the cache under a generation that
+    # signals bump. Each process also remembers the last snapshot it
+    # loaded, so an unchanged list costs one small cache read.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = {}
+
+    def get(self, name, build):
+        generation = cache.get_or_set(
+            SNAPSHOT_GENERATION_KEY.format(name),
+            lambda: uuid.uuid4().hex,
+            timeout=None
+        )
+        local = self._local.get(name)
+        if local is not None and local[0] == generation:
+            return local[1]
+        key = SNAPSHOT_KEY.format(name=name, generation=generation)
+        snapshot = cache.get(key)
+        if snapshot is None:
+            with primary():
+                snapshot = build_snapshot(build())
+            cache.set(key, snapshot, timeout=None)
+        with self._lock:
+            self._local[name] = (generation, snapshot)
+        return snapshot
+
+
+snapshots = SnapshotStore()
+
+
+def bump_snapshot(name):
+    # After commit: snapshots never expire, one built from the old rows
+    # under the new generation would be served until the next change.
+    transaction.on_commit(lambda: cache.set(
+        SNAPSHOT_GENERATION_KEY.format(name), uuid.uuid4().hex, timeout=None
+    ))
+
+
+def accepted_encodings(request):
+    accepted = set()
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        if 'q=0' not in params and 'q=0.0' not in params:
+            accepted.add(coding.lower())
+    return accepted
+
+
+def snapshot_response(request, snapshot):
+    etag = snapshot['etag']
+    if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    if '*' in if_none_match or etag in if_none_match:
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+    accepted = accepted_encodings(request)
+    encoding = next(
+        (coding for coding in ENCODINGS
+         if coding in accepted and coding in snapshot),
+        None
+    )
+    response = HttpResponse(
+        snapshot[encoding or 'identity'], content_type='application/json'
+    )
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
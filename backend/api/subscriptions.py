@@ -0,0 +1,34 @@
+from django.db.models import F, Window
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
+
+from recipe.models import Recipes
+
+DEFAULT_RECIPES_LIMIT = 3
+
+
+def get_recipes_limit(request):
+    if request is None:
+        return DEFAULT_RECIPES_LIMIT
+    try:
+        return max(int(request.query_params['recipes_limit']), 0)
+    except (KeyError, ValueError):
+        return DEFAULT_RECIPES_LIMIT
+
+
+def latest_recipes(author_ids, limit):
+    # ROW_NUMBER() OVER (PARTITION BY author_id) picks the newest `limit`
+    # recipes of every author in one query. Window expressions cannot be
+    # filtered on directly before Django 4.2, hence the wrapping select.
+    ranked = Recipes.objects.filter(author_id__in=author_ids).annotate(
+        position=Window(
+            expression=RowNumber(),
+            partition_by=F('author_id'),
+            order_by=(F('pub_date').desc(), F('id').desc()),
+        )
+    ).values('id', 'position')
+    sql, params = ranked.query.sql_with_params()
+    return Recipes.objects.filter(id__in=RawSQL(
+        f'SELECT "id" FROM ({sql}) ranked WHERE "position" <= %s',
+        (*params, limit)
+    ))
@@ -0,0 +1,36 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import call_command
+from django.utils import timezone
+
+from .download_shopping_cart import render_shopping_cart
+from .jobs import task
+from .models import Job
+
+
+@task('fill_the_base', max_attempts=1)
+def fill_the_base():
+    call_command('fill_the_base')
+
+
+@task('render_shopping_cart')
+def render_cart(user_id, file_format='txt'):
+    size = render_shopping_cart(user_id, file_format)
+    return {'format': file_format, 'size': size}
+
+
+@task('recount', every=60 * 60 * 24)
+def recount():
+    call_command('recount')
+
+
+@task('purge_jobs', every=60 * 60)
+def purge_jobs():
+    deleted, _ = Job.objects.filter(
+        status__in=(Job.DONE, Job.FAILED),
+        finished_at__lt=timezone.now() - timedelta(
+            days=settings.JOB_RETENTION_DAYS
+        )
+    ).delete()
+    return {'deleted': deleted}
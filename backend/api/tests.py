@@ -1 +1,1616 @@
-# Create your tests here.
+import base64
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import tracemalloc
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.backends.sqlite3 import base as sqlite3
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.benchmarks import ENDPOINTS, compare, run_benchmarks, seed
+from api.db_pool import PoolMetricsMixin, pool_stats, reset_pool_stats
+from api.db_router import ReplicaRouter, replica_reads
+from api.download_shopping_cart import get_cart_version
+from api.images import ingest_data_uri
+from api.ingredients_import import import_ingredients
+from api.ingredients_index import ingredients_index
+from api.instrumentation import QueryBudgetExceeded, QueryRecorder
+from api.jobs import (TASKS, enqueue, requeue_stale, run_pending,
+                      schedule_periodic)
+from api.memberships import MEMBERSHIP_KINDS, get_members, load_members
+from api.models import Job
+from api.query_audit import audit_endpoint, explain, table_sizes
+from api.views import RecipesViewSet
+from recipe.models import (Favorite, Ingredients, RecipeIngredients, Recipes,
+                           ShoppingCart, Tags)
+from users.models import Follow, User
+
+
+class FoodgramTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='cook@example.com', password='pass1234', username='cook'
+        )
+        cls.token = Token.objects.create(user=cls.user)
+        cls.salt = Ingredients.objects.create(
+            name='salt', measurement_unit='g'
+        )
+        cls.milk = Ingredients.objects.create(
+            name='milk', measurement_unit='ml'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def warm_memberships(self):
+        # Query budgets are measured with the membership sets cached.
+        for kind in MEMBERSHIP_KINDS:
+            get_members(self.user.id, kind)
+
+    @classmethod
+    def create_recipe(cls, author=None, name='recipe', ingredients=()):
+        recipe = Recipes.objects.create(
+            author=author or cls.user,
+            name=name,
+            text='text',
+            cooking_time=10,
+        )
+        RecipeIngredients.objects.bulk_create(
+            RecipeIngredients(
+                recipe=recipe, related_ingredient=ingredient, quantity=amount
+            )
+            for ingredient, amount in ingredients
+        )
+        return recipe
+
+
+class DownloadShoppingCartTest(FoodgramTestCase):
+    url = '/api/recipes/download_shopping_cart/'
+
+    def fill_cart(self, size):
+        with self.captureOnCommitCallbacks(execute=True):
+            for number in range(size):
+                recipe = self.create_recipe(
+                    name=f'recipe {number}',
+                    ingredients=((self.salt, 5), (self.milk, 100)),
+                )
+                ShoppingCart.objects.create(user=self.user, recipe=recipe)
+
+    def download(self, file_format=None):
+        params = {'format': file_format} if file_format else {}
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_totals_are_summed_per_ingredient(self):
+        self.fill_cart(3)
+        content = self.download().decode()
+        self.assertEqual(
+            content,
+            'Ingredients for shopping :)\n'
+            'milk ml 300\n'
+            'salt g 15\n'
+        )
+
+    def test_query_budget_does_not_depend_on_cart_size(self):
+        # Token lookup and the aggregation query.
+        for size in (1, 30):
+            ShoppingCart.objects.all().delete()
+            self.fill_cart(size)
+            with self.assertNumQueries(2):
+                self.download()
+
+    def test_empty_cart(self):
+        self.assertEqual(self.download(), b'Ingredients for shopping :)\n')
+
+    def test_csv_and_json_formats(self):
+        self.fill_cart(2)
+        self.assertEqual(
+            self.download('csv').decode(),
+            'name,measurement_unit,amount\r\n'
+            'milk,ml,200\r\n'
+            'salt,g,10\r\n'
+        )
+        self.assertEqual(json.loads(self.download('json')), [
+            {'name': 'milk', 'measurement_unit': 'ml', 'amount': 200},
+            {'name': 'salt', 'measurement_unit': 'g', 'amount': 10},
+        ])
+
+    def test_pdf_format(self):
+        self.fill_cart(1)
+        response = self.client.get(self.url, {'format': 'pdf'})
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(
+            b''.join(response.streaming_content).startswith(b'%PDF')
+        )
+
+    def test_unknown_format(self):
+        response = self.client.get(self.url, {'format': 'docx'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_unchanged_cart_is_served_from_cache(self):
+        self.fill_cart(2)
+        first = self.download('pdf')
+        # Only the token lookup, neither aggregation nor rendering.
+        with self.assertNumQueries(1):
+            self.assertEqual(self.download('pdf'), first)
+
+    def test_cart_changes_invalidate_cache(self):
+        self.fill_cart(1)
+        self.download()
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = self.create_recipe(ingredients=((self.salt, 1),))
+            ShoppingCart.objects.create(user=self.user, recipe=recipe)
+        self.assertIn(b'salt g 6', self.download())
+        recipe_ingredient = RecipeIngredients.objects.get(recipe=recipe)
+        recipe_ingredient.quantity = 2
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe_ingredient.save()
+        self.assertIn(b'salt g 7', self.download())
+
+    def test_cart_version_is_bumped_after_commit(self):
+        # A download racing the write must not cache the old list under
+        # the new version.
+        self.fill_cart(1)
+        version = get_cart_version(self.user.id)
+        recipe = self.create_recipe(ingredients=((self.salt, 1),))
+        with self.captureOnCommitCallbacks() as callbacks:
+            ShoppingCart.objects.create(user=self.user, recipe=recipe)
+            self.assertEqual(get_cart_version(self.user.id), version)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(get_cart_version(self.user.id), version)
+
+    def test_rendered_by_a_background_job(self):
+        self.fill_cart(2)
+        response = self.client.get(self.url, {'format': 'pdf', 'async': 1})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(run_pending(), 1)
+        job = self.client.get(f'/api/jobs/{response.data["id"]}/').data
+        self.assertEqual(job['status'], 'done')
+        with self.assertNumQueries(1):
+            self.assertTrue(self.download('pdf').startswith(b'%PDF'))
+
+
+class RecipesListTest(FoodgramTestCase):
+    url = '/api/recipes/'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.breakfast = Tags.objects.create(
+            name='Breakfast', color='#E26C2D', slug='breakfast'
+        )
+        cls.lunch = Tags.objects.create(
+            name='Lunch', color='#49B64E', slug='lunch'
+        )
+
+    def create_recipes(self, count):
+        for number in range(count):
+            author = User.objects.create_user(
+                email=f'author{number}@example.com',
+                password='pass1234',
+                username=f'author{number}',
+            )
+            recipe = self.create_recipe(
+                author=author,
+                name=f'recipe {number}',
+                ingredients=((self.salt, 1), (self.milk, 2)),
+            )
+            recipe.tags.set((self.breakfast, self.lunch))
+
+    def test_flags_follow_favorites_and_cart(self):
+        self.create_recipes(2)
+        favorite, in_cart = Recipes.objects.order_by('id')
+        Favorite.objects.create(user=self.user, recipe=favorite)
+        ShoppingCart.objects.create(user=self.user, recipe=in_cart)
+        results = {
+            item['id']: item
+            for item in self.client.get(self.url).data['results']
+        }
+        self.assertTrue(results[favorite.id]['is_favorited'])
+        self.assertFalse(results[favorite.id]['is_in_shopping_cart'])
+        self.assertFalse(results[in_cart.id]['is_favorited'])
+        self.assertTrue(results[in_cart.id]['is_in_shopping_cart'])
+        self.assertEqual(len(results[in_cart.id]['ingredients']), 2)
+        self.assertEqual(len(results[in_cart.id]['tags']), 2)
+
+    def test_list_query_budget_does_not_depend_on_page_size(self):
+        # Token, count, recipes with authors, tags and ingredients.
+        self.create_recipes(6)
+        self.warm_memberships()
+        for limit in (1, 6):
+            with self.assertNumQueries(5):
+                response = self.client.get(self.url, {'limit': limit})
+            self.assertEqual(len(response.data['results']), limit)
+
+    def test_anonymous_list_and_detail(self):
+        self.create_recipes(3)
+        client = APIClient()
+        with self.assertNumQueries(4):
+            response = client.get(self.url)
+        self.assertFalse(response.data['results'][0]['is_favorited'])
+        recipe = Recipes.objects.first()
+        with self.assertNumQueries(3):
+            response = client.get(f'{self.url}{recipe.id}/')
+        self.assertEqual(response.data['name'], recipe.name)
+
+
+class MembershipsTest(FoodgramTestCase):
+    url = '/api/recipes/'
+
+    def setUp(self):
+        super().setUp()
+        self.recipe = self.create_recipe(name='soup')
+
+    def flags(self):
+        result, = self.client.get(self.url).data['results']
+        return result['is_favorited'], result['is_in_shopping_cart']
+
+    def test_flags_come_from_the_cache(self):
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        self.assertEqual(self.flags(), (True, False))
+        self.assertEqual(
+            get_members(self.user.id, 'favorites'), {self.recipe.id}
+        )
+        with self.assertNumQueries(0):
+            get_members(self.user.id, 'cart')
+
+    def test_writes_refresh_the_cache(self):
+        self.assertEqual(self.flags(), (False, False))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                f'{self.url}{self.recipe.id}/shopping_cart/'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.flags(), (False, True))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'{self.url}{self.recipe.id}/shopping_cart/')
+        self.assertEqual(self.flags(), (False, False))
+
+    def test_author_subscription_comes_from_the_cache(self):
+        author = User.objects.create_user(
+            email='author@example.com', password='pass1234',
+            username='author'
+        )
+        self.create_recipe(author=author)
+        # The stored column is never kept up to date.
+        User.objects.filter(id=author.id).update(is_subscribed=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            Follow.objects.create(user=self.user, following=self.user)
+        results = self.client.get(self.url).data['results']
+        self.assertEqual(
+            {result['author']['id']: result['author']['is_subscribed']
+             for result in results},
+            {self.user.id: True, author.id: False}
+        )
+
+    def test_reads_do_not_overwrite_a_refresh(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Favorite.objects.create(user=self.user, recipe=self.recipe)
+        # A reader that loaded the rows before that write stores its set
+        # after the refresh. Here the rows are gone without a refresh.
+        Favorite.objects.all().delete()
+        self.assertEqual(load_members(self.user.id, 'favorites'), frozenset())
+        self.assertEqual(
+            get_members(self.user.id, 'favorites'), {self.recipe.id}
+        )
+
+
+class ResponseCacheTest(FoodgramTestCase):
+    url = '/api/recipes/'
+
+    def setUp(self):
+        super().setUp()
+        self.anonymous = APIClient()
+        self.tag = Tags.objects.create(
+            name='Breakfast', color='#E26C2D', slug='breakfast'
+        )
+        self.recipe = self.create_recipe(
+            name='omelette', ingredients=((self.milk, 1),)
+        )
+        self.recipe.tags.set((self.tag,))
+        self.detail_url = f'{self.url}{self.recipe.id}/'
+
+    def test_repeated_requests_are_served_from_cache(self):
+        first = self.anonymous.get(self.url, {'tags': 'breakfast'})
+        self.assertEqual(first['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            second = self.anonymous.get(self.url, {'tags': 'breakfast'})
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.content, first.content)
+        other = self.anonymous.get(self.url, {'tags': 'lunch'})
+        self.assertEqual(other['X-Cache'], 'MISS')
+        self.assertEqual(other.json()['results'], [])
+
+    def test_authenticated_requests_are_not_cached(self):
+        self.anonymous.get(self.url)
+        response = self.client.get(self.url)
+        self.assertNotIn('X-Cache', response)
+
+    def test_recipe_edits_invalidate(self):
+        self.anonymous.get(self.url)
+        self.anonymous.get(self.detail_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.name = 'scrambled eggs'
+            self.recipe.save()
+        for url in (self.url, self.detail_url):
+            response = self.anonymous.get(url)
+            self.assertEqual(response['X-Cache'], 'MISS')
+            self.assertContains(response, 'scrambled eggs')
+
+    def test_embedded_objects_invalidate(self):
+        self.anonymous.get(self.detail_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.name = 'Brunch'
+            self.tag.save()
+        self.assertContains(self.anonymous.get(self.detail_url), 'Brunch')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.first_name = 'Julia'
+            self.user.save()
+        self.assertContains(self.anonymous.get(self.detail_url), 'Julia')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save(update_fields=('last_login',))
+            User.objects.create_user(
+                email='new@example.com', password='pass1234', username='new'
+            ).save()
+        self.assertEqual(
+            self.anonymous.get(self.detail_url)['X-Cache'], 'HIT'
+        )
+
+    def test_detail_is_cached_by_recipe_id(self):
+        url = f'{self.url}0{self.recipe.id}/'
+        self.anonymous.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.name = 'scrambled eggs'
+            self.recipe.save()
+        response = self.anonymous.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertContains(response, 'scrambled eggs')
+        self.assertEqual(self.anonymous.get(f'{self.url}x/').status_code, 404)
+
+    def test_stats(self):
+        self.anonymous.get(self.url)
+        self.anonymous.get(self.url)
+        self.assertEqual(
+            self.client.get('/api/response_cache/stats/').status_code, 403
+        )
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(
+            self.client.get('/api/response_cache/stats/').data,
+            {'hits': 1, 'misses': 1, 'hit_ratio': 0.5}
+        )
+
+
+class RecipeListsTest(FoodgramTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.recipes = [
+            self.create_recipe(name=f'recipe {number}')
+            for number in range(4)
+        ]
+        self.ids = [recipe.id for recipe in self.recipes]
+
+    def counts(self, field):
+        return list(Recipes.objects.filter(
+            id__in=self.ids
+        ).order_by('id').values_list(field, flat=True))
+
+    def test_single_add_is_idempotent(self):
+        url = f'/api/recipes/{self.ids[0]}/favorite/'
+        for _ in range(2):
+            self.assertEqual(self.client.post(url).status_code, 200)
+        self.assertEqual(Favorite.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(self.counts('favorites_count'), [1, 0, 0, 0])
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.counts('favorites_count'), [0, 0, 0, 0])
+
+    def test_missing_recipe(self):
+        response = self.client.post('/api/recipes/0/shopping_cart/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_bulk_add_and_remove(self):
+        url = '/api/recipes/shopping_cart/'
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipes[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                url, {'recipes': self.ids[:3]}, format='json'
+            )
+        self.assertEqual(
+            [item['id'] for item in response.data], self.ids[:3]
+        )
+        self.assertEqual(self.counts('shopping_cart_count'), [1, 1, 1, 0])
+        self.assertEqual(get_members(self.user.id, 'cart'), set(self.ids[:3]))
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.delete(
+                    url, {'recipes': self.ids}, format='json'
+                )
+        self.assertEqual(response.status_code, 204)
+        deletes = [
+            query['sql'] for query in queries
+            if query['sql'].startswith('DELETE')
+        ]
+        self.assertEqual(len(deletes), 1)
+        # By the ids the SELECT before it found, one statement for all.
+        self.assertIn('"id" IN', deletes[0])
+        self.assertEqual(self.counts('shopping_cart_count'), [0, 0, 0, 0])
+        self.assertEqual(get_members(self.user.id, 'cart'), set())
+
+    def test_bulk_validation(self):
+        url = '/api/recipes/favorite/'
+        response = self.client.post(
+            url, {'recipes': [self.ids[0], 0]}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(url, {'recipes': []}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Favorite.objects.exists())
+
+
+class SubscriptionsTest(FoodgramTestCase):
+    url = '/api/users/subscriptions/'
+
+    def follow_authors(self, count, recipes_per_author=4):
+        authors = []
+        for number in range(count):
+            author = User.objects.create_user(
+                email=f'author{number}@example.com',
+                password='pass1234',
+                username=f'author{number}',
+            )
+            for recipe_number in range(recipes_per_author):
+                self.create_recipe(
+                    author=author, name=f'{author.username} {recipe_number}'
+                )
+            Follow.objects.create(user=self.user, following=author)
+            authors.append(author)
+        return authors
+
+    def test_recipes_limit_and_count(self):
+        author, = self.follow_authors(1)
+        response = self.client.get(
+            self.url, {'limit': 6, 'recipes_limit': 2}
+        )
+        result, = response.data['results']
+        self.assertEqual(result['id'], author.id)
+        self.assertEqual(result['recipes_count'], 4)
+        self.assertTrue(result['is_subscribed'])
+        self.assertEqual(
+            [recipe['name'] for recipe in result['recipes']],
+            list(Recipes.objects.filter(
+                author=author
+            ).values_list('name', flat=True)[:2])
+        )
+
+    def test_no_subscriptions(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [])
+
+    def test_recipes_limit_does_not_change_page_size(self):
+        self.follow_authors(3, recipes_per_author=1)
+        response = self.client.get(self.url, {'recipes_limit': 1})
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_query_budget_does_not_depend_on_following_count(self):
+        # Token, count, authors and latest recipes.
+        self.follow_authors(6)
+        self.warm_memberships()
+        for limit in (1, 6):
+            with self.assertNumQueries(4):
+                response = self.client.get(
+                    self.url, {'limit': limit, 'recipes_limit': 3}
+                )
+            self.assertEqual(len(response.data['results']), limit)
+            for result in response.data['results']:
+                self.assertEqual(len(result['recipes']), 3)
+
+    def test_subscribe_response(self):
+        author = User.objects.create_user(
+            email='author@example.com', password='pass1234', username='a'
+        )
+        self.create_recipe(author=author)
+        response = self.client.post(f'/api/users/{author.id}/subscribe/')
+        self.assertTrue(response.data['is_subscribed'])
+        self.assertEqual(response.data['recipes_count'], 1)
+
+
+class JobsTest(FoodgramTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.calls = []
+        patcher = mock.patch.dict(TASKS, {
+            'flaky': (self.flaky, 2, None),
+            'hourly': (self.calls.append, 3, 60 * 60),
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def flaky(self, fail=True):
+        if fail:
+            raise ValueError('flaky')
+        return 'ok'
+
+    def test_result_is_stored(self):
+        job = enqueue('flaky', {'fail': False}, user=self.user)
+        self.assertEqual(run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result), (Job.DONE, 'ok'))
+
+    def test_retries_with_backoff(self):
+        job = enqueue('flaky')
+        with self.assertLogs('api.jobs', 'ERROR'):
+            run_pending()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertEqual(run_pending(), 0)
+        Job.objects.update(run_at=timezone.now())
+        with self.assertLogs('api.jobs', 'ERROR'):
+            run_pending()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.assertIn('ValueError: flaky', job.error)
+
+    def test_stale_jobs_are_requeued_until_out_of_attempts(self):
+        started = timezone.now() - timedelta(hours=1)
+        retried = enqueue('flaky')
+        crashing = enqueue('flaky')
+        Job.objects.filter(id=retried.id).update(
+            status=Job.RUNNING, started_at=started, attempts=1
+        )
+        Job.objects.filter(id=crashing.id).update(
+            status=Job.RUNNING, started_at=started, attempts=2
+        )
+        self.assertEqual(requeue_stale(), 1)
+        retried.refresh_from_db()
+        crashing.refresh_from_db()
+        self.assertEqual(retried.status, Job.QUEUED)
+        self.assertEqual(crashing.status, Job.FAILED)
+        self.assertIsNotNone(crashing.finished_at)
+
+    def test_periodic_jobs_are_queued_once(self):
+        schedule_periodic()
+        schedule_periodic()
+        self.assertEqual(Job.objects.filter(name='hourly').count(), 1)
+
+    def test_status_is_visible_to_the_owner_only(self):
+        job = enqueue('flaky', user=self.user)
+        url = f'/api/jobs/{job.id}/'
+        self.assertEqual(self.client.get(url).data['status'], 'queued')
+        other = User.objects.create_user(
+            email='other@example.com', password='pass1234', username='other'
+        )
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class IngredientsImportTest(FoodgramTestCase):
+
+    def test_reruns_do_not_duplicate(self):
+        rows = 'salt,g\npepper,g\n pepper ,g\n,kg\nsugar,g\n'
+        progress = []
+        stats = import_ingredients(
+            io.StringIO(rows), chunk_size=2, progress=progress.append
+        )
+        self.assertEqual((stats['read'], stats['created']), (5, 2))
+        self.assertEqual(
+            [(item['read'], item['created']) for item in progress],
+            [(2, 1), (4, 1), (5, 2)]
+        )
+        stats = import_ingredients(io.StringIO(rows))
+        self.assertEqual(stats['created'], 0)
+        self.assertEqual(
+            Ingredients.objects.filter(name='pepper').count(), 1
+        )
+
+    def test_malformed_rows_are_skipped(self):
+        stats = import_ingredients(io.StringIO('flour\n\n,\nsugar,g\n'))
+        self.assertEqual(
+            (stats['read'], stats['created'], stats['skipped']), (3, 1, 2)
+        )
+        stats = import_ingredients(io.StringIO(
+            '{"name": "yeast"}\n[]\n{"name": "yeast", \n'
+            '{"name": 5, "measurement_unit": "g"}\n'
+            '{"name": "yeast", "measurement_unit": "g"}\n'
+        ), 'jsonl')
+        self.assertEqual(
+            (stats['read'], stats['created'], stats['skipped']), (5, 1, 4)
+        )
+        stats = import_ingredients(io.StringIO(
+            '[{"name": "rye", "measurement_unit": ["g"]}]'
+        ), 'json')
+        self.assertEqual((stats['created'], stats['skipped']), (0, 1))
+
+    def test_jsonl_and_json(self):
+        lines = '\n'.join(
+            json.dumps({'name': name, 'measurement_unit': 'g'})
+            for name in ('flour', 'salt')
+        )
+        stats = import_ingredients(io.StringIO(lines), 'jsonl')
+        self.assertEqual(stats['created'], 1)
+        stats = import_ingredients(
+            io.StringIO('[{"name": "yeast", "measurement_unit": "g"}]'),
+            'json'
+        )
+        self.assertEqual(stats['created'], 1)
+
+    def test_command_refreshes_the_index(self):
+        ingredients_index.search('fl')
+        with tempfile.NamedTemporaryFile(
+            'w', suffix='.jsonl', encoding='utf-8'
+        ) as file:
+            file.write('{"name": "flour", "measurement_unit": "g"}\n')
+            file.flush()
+            output = io.StringIO()
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command('fill_the_base', file.name, stdout=output)
+        self.assertIn('1 rows read, 1 ingredients created', output.getvalue())
+        self.assertEqual(
+            [item['name'] for item in ingredients_index.search('fl')],
+            ['flour']
+        )
+
+
+class IngredientsAutocompleteTest(FoodgramTestCase):
+    url = '/api/ingredients/'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Ingredients.objects.bulk_create([
+            Ingredients(name='Сахар', measurement_unit='г'),
+            Ingredients(name='сахарная пудра', measurement_unit='г'),
+            Ingredients(name='ванильный сахар', measurement_unit='г'),
+            Ingredients(name='соль', measurement_unit='г'),
+        ])
+
+    def search(self, name):
+        response = APIClient().get(self.url, {'name': name})
+        return [item['name'] for item in response.data]
+
+    def test_prefix_matches_come_before_substring_matches(self):
+        self.assertEqual(
+            self.search('сах'),
+            ['Сахар', 'сахарная пудра', 'ванильный сахар']
+        )
+
+    def test_result_limit(self):
+        with override_settings(INGREDIENTS_SEARCH_LIMIT=2):
+            self.assertEqual(self.search('САХ'), ['Сахар', 'сахарная пудра'])
+
+    def test_answered_without_database(self):
+        self.search('соль')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.search('соль'), ['соль'])
+
+    def test_index_follows_changes(self):
+        self.assertEqual(self.search('солод'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            malt = Ingredients.objects.create(
+                name='солод', measurement_unit='г'
+            )
+            # Not rebuilt before the commit.
+            self.assertEqual(self.search('солод'), [])
+        self.assertEqual(self.search('солод'), ['солод'])
+        with self.captureOnCommitCallbacks(execute=True):
+            malt.delete()
+        self.assertEqual(self.search('солод'), [])
+
+
+class ReferenceSnapshotTest(FoodgramTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.tag = Tags.objects.create(
+            name='Breakfast', color='#E26C2D', slug='breakfast'
+        )
+
+    def test_unchanged_list_answers_not_modified(self):
+        client = APIClient()
+        response = client.get('/api/tags/')
+        self.assertEqual(json.loads(response.content), [{
+            'id': self.tag.id,
+            'name': 'Breakfast',
+            'color': '#E26C2D',
+            'slug': 'breakfast',
+        }])
+        with self.assertNumQueries(0):
+            response = client.get(
+                '/api/tags/', HTTP_IF_NONE_MATCH=response['ETag']
+            )
+        self.assertEqual(response.status_code, 304)
+
+    def test_precompressed_ingredients(self):
+        response = APIClient().get(
+            '/api/ingredients/', HTTP_ACCEPT_ENCODING='gzip, deflate'
+        )
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(
+            [item['name']
+             for item in json.loads(gzip.decompress(response.content))],
+            ['salt', 'milk']
+        )
+
+    def test_changes_bump_the_version(self):
+        client = APIClient()
+        etag = client.get('/api/ingredients/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredients.objects.create(name='sugar', measurement_unit='g')
+            # Until the commit the old generation is still current.
+            response = client.get(
+                '/api/ingredients/', HTTP_IF_NONE_MATCH=etag
+            )
+            self.assertEqual(response.status_code, 304)
+        response = client.get('/api/ingredients/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(json.loads(response.content)), 3)
+
+
+class RecipeWriteTestCase(FoodgramTestCase):
+    url = '/api/recipes/'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.tag = Tags.objects.create(
+            name='Breakfast', color='#E26C2D', slug='breakfast'
+        )
+        cls.ingredients = Ingredients.objects.bulk_create(
+            Ingredients(name=f'ingredient {number}', measurement_unit='g')
+            for number in range(25)
+        )
+
+    def payload(self, ingredients, **fields):
+        return {
+            'tags': [self.tag.id],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': amount}
+                for ingredient, amount in ingredients
+            ],
+            'name': 'Omelette',
+            'text': 'Beat the eggs',
+            'cooking_time': 5,
+            **fields,
+        }
+
+
+class RecipeWriteTest(RecipeWriteTestCase):
+
+    def create(self, ingredients):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                self.url, self.payload(ingredients), format='json'
+            )
+        self.assertEqual(response.status_code, 201, response.data)
+        return response, len(queries)
+
+    def test_create_query_count_does_not_depend_on_ingredients(self):
+        self.warm_memberships()
+        _, one = self.create([(self.ingredients[0], 1)])
+        response, many = self.create(
+            [(ingredient, 2) for ingredient in self.ingredients]
+        )
+        self.assertEqual(one, many)
+        self.assertEqual(len(response.data['ingredients']), 25)
+        self.assertEqual(
+            {item['quantity'] for item in response.data['ingredients']}, {2}
+        )
+
+    def test_unknown_ingredient_is_rejected(self):
+        payload = self.payload([(self.ingredients[0], 1)])
+        payload['ingredients'].append({'id': 0, 'amount': 1})
+        response = self.client.post(self.url, payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Recipes.objects.exists())
+
+    def test_update_writes_only_the_difference(self):
+        first, second, third = self.ingredients[:3]
+        response, _ = self.create([(first, 1), (second, 2)])
+        recipe = Recipes.objects.get(id=response.data['id'])
+        kept = RecipeIngredients.objects.get(
+            recipe=recipe, related_ingredient=first
+        )
+        response = self.client.patch(
+            f'{self.url}{recipe.id}/',
+            self.payload([(first, 1), (third, 7)], name='Scrambled eggs'),
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['name'], 'Scrambled eggs')
+        self.assertEqual(
+            dict(recipe.recipe_with_ing.values_list(
+                'related_ingredient', 'quantity'
+            )),
+            {first.id: 1, third.id: 7}
+        )
+        self.assertTrue(
+            RecipeIngredients.objects.filter(id=kept.id).exists()
+        )
+
+
+def image_data_uri(size=(2, 2), image_format='PNG', noise=False):
+    image = Image.frombytes(
+        'RGB', size,
+        os.urandom(size[0] * size[1] * 3) if noise
+        else bytes(size[0] * size[1] * 3)
+    )
+    buffer = io.BytesIO()
+    image.save(buffer, image_format)
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/{image_format.lower()};base64,{encoded}'
+
+
+class ImageUploadTest(RecipeWriteTestCase):
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def post_image(self, image):
+        return self.client.post(
+            self.url,
+            self.payload([(self.ingredients[0], 1)], image=image),
+            format='json'
+        )
+
+    def test_identical_images_share_one_file(self):
+        image = image_data_uri()
+        first = self.post_image(image)
+        second = self.post_image(image)
+        self.assertEqual(first.status_code, 201, first.data)
+        self.assertEqual(first.data['image'], second.data['image'])
+        recipes = Recipes.objects.all()
+        self.assertEqual(len({recipe.image.name for recipe in recipes}), 1)
+        self.assertTrue(recipes[0].image.name.endswith('.png'))
+
+    def test_limits_and_format_are_enforced(self):
+        image = image_data_uri()
+        with override_settings(IMAGE_UPLOAD_MAX_BYTES=10):
+            self.assertEqual(self.post_image(image).status_code, 400)
+        with override_settings(IMAGE_UPLOAD_MAX_PIXELS=3):
+            self.assertEqual(self.post_image(image).status_code, 400)
+        not_an_image = 'data:image/png;base64,' + base64.b64encode(
+            b'plain text'
+        ).decode()
+        self.assertEqual(self.post_image(not_an_image).status_code, 400)
+        self.assertEqual(
+            self.post_image('data:image/png;base64,***').status_code, 400
+        )
+        self.assertFalse(Recipes.objects.exists())
+
+    @override_settings(IMAGE_UPLOAD_SPOOL_SIZE=64 * 1024)
+    def test_peak_memory_is_bounded(self):
+        data = image_data_uri((600, 600), noise=True)
+        tracemalloc.start()
+        image = ingest_data_uri(data)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        image.close()
+        # The decoded image is about 1 MB, only chunks stay in memory.
+        self.assertLess(peak, 512 * 1024)
+
+
+class RecipesCursorPaginationTest(FoodgramTestCase):
+    url = '/api/recipes/'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for number in range(7):
+            cls.create_recipe(name=f'recipe {number}')
+        # Equal pub_date for some recipes, id breaks the tie.
+        first = Recipes.objects.order_by('id').first()
+        Recipes.objects.filter(id__lte=first.id + 3).update(
+            pub_date=first.pub_date
+        )
+        cls.expected = list(
+            Recipes.objects.order_by('-pub_date', '-id')
+            .values_list('id', flat=True)
+        )
+
+    def walk(self, url, link='next'):
+        pages = []
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(
+                any('COUNT(' in query['sql'] for query in queries)
+            )
+            pages.append([recipe['id'] for recipe in response.data['results']])
+            url = response.data[link]
+        return pages
+
+    def test_next_links_walk_the_feed_in_order(self):
+        pages = self.walk(f'{self.url}?pagination=cursor&limit=3')
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), self.expected)
+
+    def test_previous_links_walk_back(self):
+        last_page = self.walk(f'{self.url}?pagination=cursor&limit=3')[-1]
+        response = self.client.get(
+            f'{self.url}?pagination=cursor&limit=3'
+        )
+        url = self.client.get(response.data['next']).data['next']
+        response = self.client.get(url)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']], last_page
+        )
+        pages = self.walk(response.data['previous'], link='previous')
+        self.assertEqual(sum(reversed(pages), []), self.expected[:6])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_page_numbers_stay_the_default(self):
+        response = self.client.get(self.url, {'limit': 3, 'page': 2})
+        self.assertEqual(response.data['count'], 7)
+
+
+class RecipeSearchTest(FoodgramTestCase):
+    url = '/api/recipes/'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other = User.objects.create_user(
+            email='other@example.com', password='pass1234', username='other'
+        )
+        cls.soup = cls.create_recipe(name='Борщ')
+        cls.soup.text = 'Свекольный суп со сметаной'
+        cls.soup.save()
+        cls.salad = cls.create_recipe(name='Салат со свеклой')
+        cls.other_soup = cls.create_recipe(author=cls.other, name='Суп')
+
+    def search(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_name_matches_rank_first(self):
+        self.assertEqual(
+            self.search(search='суп'), [self.other_soup.id, self.soup.id]
+        )
+
+    def test_search_combines_with_filters(self):
+        self.warm_memberships()
+        with self.assertNumQueries(5):
+            found = self.search(search='суп', author=self.user.id)
+        self.assertEqual(found, [self.soup.id])
+
+    def test_index_follows_edits(self):
+        self.salad.name = 'Винегрет'
+        self.salad.save()
+        self.assertEqual(self.search(search='салат'), [])
+        self.assertEqual(self.search(search='винегрет'), [self.salad.id])
+        self.salad.delete()
+        self.assertEqual(self.search(search='винегрет'), [])
+
+    def test_operators_are_not_interpreted(self):
+        self.assertEqual(self.search(search='"суп" OR *'), [])
+
+
+class WhatCanICookTest(FoodgramTestCase):
+    url = '/api/recipes/what_can_i_cook/'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.eggs, cls.flour, cls.butter = Ingredients.objects.bulk_create(
+            Ingredients(name=name, measurement_unit='g')
+            for name in ('eggs', 'flour', 'butter')
+        )
+        cls.omelette = cls.create_recipe(
+            name='omelette', ingredients=((cls.eggs, 3), (cls.milk, 50))
+        )
+        cls.pancakes = cls.create_recipe(
+            name='pancakes',
+            ingredients=((cls.eggs, 2), (cls.milk, 200), (cls.flour, 100)),
+        )
+        cls.shortbread = cls.create_recipe(
+            name='shortbread', ingredients=((cls.flour, 200), (cls.butter, 1))
+        )
+
+    def cook(self, *ingredients):
+        response = self.client.get(self.url, {
+            'ingredients': ','.join(str(item.id) for item in ingredients)
+        })
+        self.assertEqual(response.status_code, 200)
+        return [
+            (recipe['name'], recipe['coverage'], recipe['missing_ingredients'])
+            for recipe in response.data['results']
+        ]
+
+    def test_ranked_by_coverage(self):
+        self.assertEqual(self.cook(self.eggs, self.milk), [
+            ('omelette', 1.0, 0),
+            ('pancakes', 0.6667, 1),
+        ])
+        self.assertEqual(self.cook(self.flour)[0], ('shortbread', 0.5, 1))
+
+    def test_index_follows_recipe_writes(self):
+        self.assertEqual(self.cook(self.butter), [('shortbread', 0.5, 1)])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/recipes/', {
+                'tags': [],
+                'ingredients': [{'id': self.butter.id, 'amount': 10}],
+                'name': 'ghee',
+                'text': 'Melt the butter',
+                'cooking_time': 30,
+            }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(
+            self.cook(self.butter),
+            [('ghee', 1.0, 0), ('shortbread', 0.5, 1)]
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shortbread.delete()
+        self.assertEqual(self.cook(self.butter), [('ghee', 1.0, 0)])
+
+    def test_invalid_ids(self):
+        response = self.client.get(self.url, {'ingredients': 'eggs'})
+        self.assertEqual(response.status_code, 400)
+
+
+class RecipesFilterTest(FoodgramTestCase):
+    url = '/api/recipes/'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other = User.objects.create_user(
+            email='other@example.com', password='pass1234', username='other'
+        )
+        cls.breakfast, cls.lunch, cls.dinner = Tags.objects.bulk_create(
+            Tags(name=slug, color='#E26C2D', slug=slug)
+            for slug in ('breakfast', 'lunch', 'dinner')
+        )
+        cls.porridge = cls.create_recipe(name='porridge')
+        cls.porridge.tags.set((cls.breakfast,))
+        cls.sandwich = cls.create_recipe(name='sandwich')
+        cls.sandwich.tags.set((cls.breakfast, cls.lunch))
+        Recipes.objects.filter(id=cls.sandwich.id).update(cooking_time=30)
+        cls.stew = cls.create_recipe(author=cls.other, name='stew')
+        cls.stew.tags.set((cls.lunch, cls.dinner))
+        Favorite.objects.create(user=cls.user, recipe=cls.sandwich)
+        Favorite.objects.create(user=cls.user, recipe=cls.stew)
+        ShoppingCart.objects.create(user=cls.user, recipe=cls.porridge)
+
+    def names(self, query):
+        response = self.client.get(f'{self.url}?{query}')
+        self.assertEqual(response.status_code, 200, response.data)
+        return sorted(recipe['name'] for recipe in response.data['results'])
+
+    def test_tags_any_and_all(self):
+        self.assertEqual(
+            self.names('tags=breakfast&tags=dinner'),
+            ['porridge', 'sandwich', 'stew']
+        )
+        self.assertEqual(
+            self.names('tags=breakfast&tags=lunch&tags_mode=all'),
+            ['sandwich']
+        )
+        self.assertEqual(self.names('tags=unknown'), [])
+
+    def test_favorites_keep_the_author_filter(self):
+        self.assertEqual(self.names('is_favorited=1'), ['sandwich', 'stew'])
+        self.assertEqual(
+            self.names(f'is_favorited=1&author={self.user.id}'), ['sandwich']
+        )
+        self.assertEqual(self.names('is_in_shopping_cart=1'), ['porridge'])
+        self.assertEqual(
+            self.names('is_in_shopping_cart=0&tags=breakfast'), ['sandwich']
+        )
+
+    def test_cooking_time_range(self):
+        self.assertEqual(
+            self.names('cooking_time__gte=20&cooking_time__lte=40'),
+            ['sandwich']
+        )
+        response = self.client.get(self.url, {'cooking_time__lte': 'soon'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_anonymous_favorites(self):
+        response = APIClient().get(self.url, {'is_favorited': 1})
+        self.assertEqual(response.data['results'], [])
+
+    def test_combined_filters_run_in_one_query(self):
+        # Token, count, recipes, tags and ingredients.
+        self.warm_memberships()
+        with self.assertNumQueries(5):
+            names = self.names(
+                'tags=breakfast&tags=lunch&is_favorited=1'
+                '&is_in_shopping_cart=0&cooking_time__lte=60'
+            )
+        self.assertEqual(names, ['sandwich', 'stew'])
+
+
+class SQLInstrumentationTest(RecipeWriteTestCase):
+
+    def test_server_timing(self):
+        response = self.client.get(self.url)
+        self.assertRegex(
+            response['Server-Timing'],
+            r'^db;dur=[\d.]+;desc="\d+ queries", app;dur=[\d.]+, '
+            r'total;dur=[\d.]+$'
+        )
+
+    def test_repeated_queries(self):
+        recorder = QueryRecorder()
+        recorder.queries = [
+            ('SELECT * FROM a WHERE id IN (%s, %s)', 0.1),
+            ('SELECT * FROM a WHERE id IN (%s)', 0.1),
+            ('SELECT * FROM b', 0.3),
+        ]
+        self.assertEqual(
+            recorder.duplicates(1),
+            [('SELECT * FROM a WHERE id IN (...)', 2)]
+        )
+        self.assertEqual(recorder.slowest(), ('SELECT * FROM b', 0.3))
+
+    @override_settings(SLOW_REQUEST_MS=0)
+    def test_slow_requests_are_logged(self):
+        with self.assertLogs('api.instrumentation', 'WARNING') as logs:
+            self.client.get(self.url)
+        self.assertIn('GET /api/recipes/', logs.output[0])
+        self.assertIn('slowest', logs.output[0])
+
+    @override_settings(SQL_STRICT_BUDGETS=True)
+    def test_endpoints_stay_within_budget(self):
+        response = self.client.post(
+            self.url,
+            self.payload([(ingredient, 1) for ingredient in self.ingredients]),
+            format='json'
+        )
+        recipe_url = f'{self.url}{response.data["id"]}/'
+        cache.clear()
+        self.client.get(self.url)
+        self.client.get(recipe_url)
+        self.client.patch(
+            recipe_url, self.payload([(self.ingredients[0], 2)]),
+            format='json'
+        )
+        self.client.post(f'{recipe_url}favorite/')
+        self.client.post(
+            f'{self.url}shopping_cart/', {'recipes': [response.data['id']]},
+            format='json'
+        )
+        self.client.get('/api/users/subscriptions/')
+        self.client.get('/api/ingredients/', {'name': 'ingr'})
+        self.client.get('/api/tags/')
+        self.client.delete(recipe_url)
+
+    @override_settings(SQL_STRICT_BUDGETS=True)
+    def test_strict_mode_fails_over_budget(self):
+        with mock.patch.object(RecipesViewSet, 'query_budget', {'list': 1}):
+            with self.assertRaisesMessage(
+                QueryBudgetExceeded, 'ran 2 queries, its budget is 1'
+            ):
+                self.client.get(self.url)
+
+
+class BenchmarksTest(TestCase):
+
+    def test_seeded_run(self):
+        results = run_benchmarks(
+            10, repeat=2, endpoints=('recipes_list', 'recipe_create')
+        )
+        self.assertEqual(set(results), {'recipes_list', 'recipe_create'})
+        self.assertEqual(results['recipes_list']['queries'], 5)
+
+    def test_regressions(self):
+        baseline = {'100': {'tags': {
+            'p50_ms': 10, 'p95_ms': 20, 'queries': 1, 'peak_kb': 100
+        }}}
+        noise = {'100': {'tags': {
+            'p50_ms': 14, 'p95_ms': 60, 'queries': 1, 'peak_kb': 300
+        }}}
+        self.assertEqual(compare(noise, baseline, 0.5), [])
+        worse = {'100': {'tags': {
+            'p50_ms': 30, 'p95_ms': 40, 'queries': 3, 'peak_kb': 100
+        }}}
+        self.assertEqual(compare(worse, baseline, 0.5), [
+            'tags @ 100: 3 queries, baseline 1',
+            'tags @ 100: p50_ms 30, baseline 10',
+        ])
+
+
+class SeedScaleTest(TestCase):
+
+    def snapshot(self):
+        # Rows by position rather than id, ids differ between runs.
+        users = {
+            user_id: number for number, user_id in enumerate(
+                User.objects.order_by('id').values_list('id', flat=True)
+            )
+        }
+        recipes = {
+            recipe_id: number for number, recipe_id in enumerate(
+                Recipes.objects.order_by('id').values_list('id', flat=True)
+            )
+        }
+        return {
+            'recipes': [
+                (users[author], name, cooking_time, pub_date)
+                for author, name, cooking_time, pub_date
+                in Recipes.objects.order_by('id').values_list(
+                    'author', 'name', 'cooking_time', 'pub_date'
+                )
+            ],
+            'favorites': sorted(
+                (users[user], recipes[recipe])
+                for user, recipe in Favorite.objects.values_list(
+                    'user', 'recipe'
+                )
+            ),
+            'follows': sorted(
+                (users[user], users[following])
+                for user, following in Follow.objects.values_list(
+                    'user', 'following'
+                )
+            ),
+            'ingredients': RecipeIngredients.objects.count(),
+        }
+
+    def seed(self, seed=7):
+        call_command(
+            'seed_scale', users=20, recipes=50, favorites=200, cart=30,
+            follows=60, seed=seed, chunk_size=16, stdout=io.StringIO()
+        )
+
+    def test_deterministic_and_consistent(self):
+        self.seed()
+        first = self.snapshot()
+        self.assertEqual(User.objects.count(), 20)
+        self.assertEqual(len(first['recipes']), 50)
+        self.assertGreater(len(first['favorites']), 50)
+        self.assertFalse(
+            any(user == other for user, other in first['follows'])
+        )
+        self.assertEqual(
+            sum(Recipes.objects.values_list('favorites_count', flat=True)),
+            len(first['favorites'])
+        )
+        Recipes.objects.all().delete()
+        User.objects.all().delete()
+        self.seed()
+        self.assertEqual(self.snapshot(), first)
+        Recipes.objects.all().delete()
+        User.objects.all().delete()
+        self.seed(seed=8)
+        self.assertNotEqual(self.snapshot()['favorites'], first['favorites'])
+
+
+class QueryAuditTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed(20)
+
+    def test_flags_scans_and_sorts(self):
+        sizes = table_sizes()
+        findings, _ = explain(
+            'SELECT * FROM "recipe_tags" ORDER BY "name"', sizes, min_rows=1
+        )
+        self.assertEqual(findings, [
+            'seq scan on recipe_tags (6 rows)',
+            'use temp b-tree for order by',
+        ])
+        self.assertEqual(explain(
+            'SELECT * FROM "recipe_tags" ORDER BY "name"', sizes
+        )[0], [])
+
+    def test_feed_uses_its_index(self):
+        result = audit_endpoint(
+            'recipes_list', self.data, table_sizes(), min_rows=1
+        )
+        self.assertEqual(result['status'], 200)
+        feed = [
+            query for query in result['explained']
+            if 'ORDER BY "recipe_recipes"."pub_date" DESC' in query['sql']
+        ]
+        self.assertEqual(len(feed), 1)
+        self.assertEqual(feed[0]['findings'], [])
+
+    @override_settings(SQL_STRICT_BUDGETS=True)
+    def test_endpoints_stay_within_budget_with_cold_caches(self):
+        # The audit runs without caches, query_budget is set for that.
+        sizes = table_sizes()
+        for name in ENDPOINTS:
+            with self.subTest(endpoint=name):
+                result = audit_endpoint(name, self.data, sizes)
+                self.assertLess(result['status'], 400)
+
+    def test_writes_are_rolled_back(self):
+        recipes = Recipes.objects.count()
+        result = audit_endpoint('recipe_create', self.data, table_sizes())
+        self.assertEqual(result['status'], 201)
+        self.assertEqual(Recipes.objects.count(), recipes)
+
+
+class MeteredDatabaseWrapper(PoolMetricsMixin, sqlite3.DatabaseWrapper):
+    pass
+
+
+class DBPoolTest(FoodgramTestCase):
+
+    def setUp(self):
+        super().setUp()
+        reset_pool_stats()
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.database = MeteredDatabaseWrapper({
+            **connection.settings_dict,
+            'NAME': os.path.join(self.path, 'pool.sqlite3'),
+            'CONN_MAX_AGE': 60,
+            'CONN_HEALTH_CHECKS': True,
+        })
+        self.addCleanup(self.database.close)
+
+    def request(self):
+        # What Django does around every request.
+        self.database.close_if_unusable_or_obsolete()
+        with self.database.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.execute('SELECT 2')
+        self.database.close_if_unusable_or_obsolete()
+
+    def counters(self):
+        stats = pool_stats()
+        return {
+            name: stats[name] for name in (
+                'acquired', 'reused', 'opened', 'closed', 'open',
+                'health_check_failures',
+            )
+        }
+
+    def test_connections_are_reused(self):
+        for _ in range(3):
+            self.request()
+        self.assertEqual(self.counters(), {
+            'acquired': 3, 'reused': 2, 'opened': 1, 'closed': 0,
+            'open': 1, 'health_check_failures': 0,
+        })
+        self.assertEqual(pool_stats()['reuse_ratio'], 0.6667)
+
+    def test_obsolete_and_broken_connections_are_replaced(self):
+        self.request()
+        self.database.close_at = 0
+        self.request()
+        with mock.patch.object(
+            MeteredDatabaseWrapper, 'is_usable', return_value=False
+        ):
+            self.request()
+        self.assertEqual(self.counters(), {
+            'acquired': 3, 'reused': 0, 'opened': 3, 'closed': 2,
+            'open': 1, 'health_check_failures': 1,
+        })
+
+    def test_stats(self):
+        url = '/api/db_pool/stats/'
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(url)
+        self.assertEqual(response.data['pid'], os.getpid())
+        self.assertEqual(response.data['conn_max_age'], 60)
+
+
+@override_settings(ASYNC_CONCURRENT_QUERIES=False)
+class AsyncViewsTest(FoodgramTestCase):
+    # Every async view must answer exactly like the DRF view it serves.
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.tag = Tags.objects.create(name='Lunch', slug='lunch')
+        cls.author = User.objects.create_user(
+            email='chef@example.com', password='pass1234', username='chef'
+        )
+        Follow.objects.create(user=cls.user, following=cls.author)
+        for number in range(8):
+            recipe = cls.create_recipe(
+                author=cls.author, name=f'soup {number}',
+                ingredients=((cls.salt, 5), (cls.milk, number + 1)),
+            )
+            recipe.tags.add(cls.tag)
+        Favorite.objects.create(user=cls.user, recipe=recipe)
+        ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        cls.recipe = recipe
+
+    def assertSameResponse(self, url, params=None, anonymous=False):
+        client = APIClient() if anonymous else self.client
+        expected = client.get(url, params)
+        with override_settings(ROOT_URLCONF='foodgram.async_urls'):
+            cache.clear()
+            response = client.get(url, params)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.content, expected.content)
+        return response
+
+    def test_read_endpoints(self):
+        for url, params in (
+            ('/api/recipes/', {}),
+            ('/api/recipes/', {'limit': 3, 'page': 2}),
+            ('/api/recipes/', {'tags': 'lunch', 'is_favorited': 1}),
+            ('/api/recipes/', {'page': 9}),
+            ('/api/recipes/', {'pagination': 'cursor'}),
+            ('/api/recipes/', {'author': 'x'}),
+            (f'/api/recipes/{self.recipe.id}/', {}),
+            ('/api/recipes/0/', {}),
+            ('/api/users/subscriptions/', {'recipes_limit': 2}),
+            ('/api/tags/', {}),
+            ('/api/ingredients/', {}),
+            ('/api/ingredients/', {'name': 'sa'}),
+        ):
+            with self.subTest(url=url, params=params):
+                self.assertSameResponse(url, params)
+        for url in ('/api/recipes/', f'/api/recipes/{self.recipe.id}/'):
+            with self.subTest(url=url, anonymous=True):
+                self.assertSameResponse(url, anonymous=True)
+        response = self.assertSameResponse(
+            '/api/users/subscriptions/', anonymous=True
+        )
+        self.assertEqual(response.json()['count'], 0)
+
+    def test_invalid_token(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token wrong')
+        response = self.assertSameResponse('/api/recipes/')
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(ROOT_URLCONF='foodgram.async_urls')
+    def test_writes_fall_back_to_the_viewset(self):
+        response = self.client.post('/api/recipes/', {
+            'tags': [self.tag.id],
+            'ingredients': [{'id': self.salt.id, 'amount': 3}],
+            'name': 'bread',
+            'text': 'text',
+            'cooking_time': 30,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        response = self.client.delete(f'/api/recipes/{response.data["id"]}/')
+        self.assertEqual(response.status_code, 204)
+
+    @override_settings(ROOT_URLCONF='foodgram.async_urls')
+    def test_asgi_handler(self):
+        # Extra arguments are ASGI header names here.
+        response = async_to_sync(AsyncClient().get)(
+            '/api/recipes/', {'limit': 2},
+            AUTHORIZATION=f'Token {self.token.key}'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 8)
+        self.assertIn('desc="8 queries"', response['Server-Timing'])
+
+
+REPLICA = 'replica'
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA])
+class ReplicaRoutingTest(FoodgramTestCase):
+    # A second local database stands in for the replica. It is migrated
+    # but holds no recipes, so a response tells where it was read from.
+    # The test runner only knows the configured databases, so this one
+    # is created here, outside the test transactions.
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        default = connections['default'].settings_dict
+        settings.DATABASES[REPLICA] = connections.settings[REPLICA] = {
+            **default,
+            'NAME': f'{default["NAME"]}_replica',
+            'TEST': {**default['TEST'], 'NAME': None, 'MIRROR': None},
+        }
+        cls.replica_name = connections[REPLICA].creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[REPLICA].creation.destroy_test_db(
+            cls.replica_name, verbosity=0
+        )
+        del connections[REPLICA]
+        del connections.settings[REPLICA]
+        settings.DATABASES.pop(REPLICA, None)
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.author = User.objects.create_user(
+            email='author@example.com', password='pass1234',
+            username='author'
+        )
+        cls.recipe = cls.create_recipe(author=cls.author)
+
+    def recipes_count(self, client=None):
+        response = (client or self.client).get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['count']
+
+    def test_safe_requests_read_from_the_replica(self):
+        with CaptureQueriesContext(connections[REPLICA]) as replica:
+            self.assertEqual(self.recipes_count(), 0)
+        self.assertTrue(replica.captured_queries)
+        response = self.client.get(f'/api/recipes/{self.recipe.id}/')
+        self.assertEqual(response.status_code, 404)
+        with override_settings(DATABASE_REPLICAS=[]):
+            self.assertEqual(self.recipes_count(), 1)
+
+    @override_settings(
+        ROOT_URLCONF='foodgram.async_urls', ASYNC_CONCURRENT_QUERIES=False
+    )
+    def test_async_views_read_from_the_replica(self):
+        response = async_to_sync(AsyncClient().get)(
+            '/api/recipes/', AUTHORIZATION=f'Token {self.token.key}'
+        )
+        self.assertEqual(response.json()['count'], 0)
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        response = self.client.post(f'/api/recipes/{self.recipe.id}/favorite/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.recipes_count(), 1)
+        other = User.objects.create_user(
+            email='other@example.com', password='pass1234', username='other'
+        )
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=other)}'
+        )
+        self.assertEqual(self.recipes_count(client), 0)
+        with override_settings(DB_PRIMARY_STICKY_SECONDS=0):
+            self.client.delete(f'/api/recipes/{self.recipe.id}/favorite/')
+        self.assertEqual(self.recipes_count(), 0)
+
+    def test_shared_caches_are_filled_from_the_primary(self):
+        self.assertEqual(self.recipes_count(APIClient()), 1)
+        self.assertEqual(
+            get_members(self.user.id, 'favorites'), frozenset()
+        )
+
+    def test_other_reads_stay_on_the_primary(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(Recipes), 'default')
+        token = replica_reads.set(True)
+        try:
+            self.assertEqual(router.db_for_read(Recipes), REPLICA)
+            self.assertEqual(router.db_for_read(Token), 'default')
+            self.assertEqual(router.db_for_write(Recipes), 'default')
+        finally:
+            replica_reads.reset(token)
+        response = self.client.get('/api/users/me/')
+        self.assertEqual(response.status_code, 200)
@@ -3,10 +3,13 @@ from django.conf.urls.static import static
 from django.urls import include, path, re_path
 from rest_framework.routers import DefaultRouter
 
-from .views import (AllFollowingView, DownloadShoppingCartView, FavoriteView,
-                    FollowView, IngredientsViewSet, CustomAuthToken,
+from .views import (AllFollowingView, DBPoolStatsView,
+                    DownloadShoppingCartView, FavoriteBulkView,
+                    FavoriteView, FollowView,
+                    IngredientsViewSet, CustomAuthToken, JobViewSet,
                     LogoutView,
-                    RecipesViewSet, RegisterView, ShoppingCartView, TagViewSet,
+                    RecipesViewSet, RegisterView, ResponseCacheStatsView,
+                    ShoppingCartBulkView, ShoppingCartView, TagViewSet,
                     UserCustomViewSet)
 
 router_v1 = DefaultRouter()
@@ -16,6 +19,7 @@ router_v1.register('users/subscriptions', AllFollowingView)
 router_v1.register('recipes', RecipesViewSet, basename='recipes')
 router_v1.register('ingredients', IngredientsViewSet)
 router_v1.register('users', UserCustomViewSet)
+router_v1.register('jobs', JobViewSet, basename='jobs')
 
 
 urlpatterns = [
@@ -28,6 +32,10 @@ urlpatterns = [
         'recipes/download_shopping_cart/', DownloadShoppingCartView.as_view()
     ),
     path('recipes/<int:pk1>/favorite/', FavoriteView.as_view()),
+    path('recipes/shopping_cart/', ShoppingCartBulkView.as_view()),
+    path('recipes/favorite/', FavoriteBulkView.as_view()),
+    path('response_cache/stats/', ResponseCacheStatsView.as_view()),
+    path('db_pool/stats/', DBPoolStatsView.as_view()),
     path('auth/token/login/', CustomAuthToken.as_view(), name='login'),
     path('auth/token/logout/', LogoutView.as_view(), name='logout'),
     path('', include(router_v1.urls)),
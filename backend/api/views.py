@@ -1,28 +1,46 @@
 import datetime
 
 import jwt
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import mixins, permissions, status, viewsets
+from rest_framework.decorators import action
 from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.authtoken.models import Token
 
-from .download_shopping_cart import download_shopping_cart
-from .filters import IngredientsFilter
-from .serializers import (CustomSetPasswordSerializer, IngredientsSerializer,
+from .cook_index import cook_index
+from .db_pool import pool_stats
+from .download_shopping_cart import (SHOPPING_LIST_FORMATS,
+                                     download_shopping_cart)
+from .filters import IngredientsFilter, RecipesFilter
+from .ingredients_index import ingredients_index
+from .jobs import enqueue
+from .models import Job
+from .serializers import (CookRecipesSerializer, CustomSetPasswordSerializer,
+                          IngredientsSerializer, JobSerializer,
+                          RecipeIdsSerializer,
                           RecipesSerializer, ShoppingCartSerializer,
                           TagSerializer, UserFollowSerializer,
                           UserRegistrationSerializer, UserSerializer,
-                          UserLogin, NewUserSerializer, RecipesPostSerializer
-                          )
-from recipe.models import (Favorite, Ingredients,
+                          UserLogin, NewUserSerializer, RecipesPostSerializer,
+                          delete_recipe_ingredients,
+                          recipe_ingredients_prefetch)
+from recipe.models import (Ingredients,
                            Recipes, ShoppingCart, Tags)
 from users.models import Follow, User
-from .pagination import CustomPagination, CustomSubscriptionsPagination
+from .pagination import (CustomPagination, CustomSubscriptionsPagination,
+                         RecipesPagination)
+from .recipe_lists import add_recipes, remove_recipes
+from .response_cache import (RECIPE, RECIPE_REFS, RECIPES, cached_response,
+                             response_cache_stats)
+from .snapshots import snapshot_response, snapshots
+from .subscriptions import get_recipes_limit, latest_recipes
 
 
 class RegisterView(APIView):
@@ -109,10 +127,24 @@ class UserCustomViewSet(UserViewSet):
 
 
 class RecipesViewSet(viewsets.ModelViewSet):
+    # Checked by api/instrumentation.py, with cold caches.
+    query_budget = {
+        'list': 8,
+        'retrieve': 7,
+        'what_can_i_cook': 8,
+        'create': 19,
+        'update': 24,
+        'partial_update': 24,
+        'destroy': 19,
+    }
     serializer_class = RecipesSerializer
     post_serializer_class = RecipesPostSerializer
     permission_classes = (permissions.AllowAny,)
-    pagination_class = CustomPagination
+    pagination_class = RecipesPagination
+    filter_backends = (DjangoFilterBackend,)
+    filterset_class = RecipesFilter
+    # Safe requests may read from a replica, see api/db_router.py.
+    replica_reads = True
 
     def get_serializer_class(self):
         if self.request.method in permissions.SAFE_METHODS:
@@ -120,31 +152,75 @@ class RecipesViewSet(viewsets.ModelViewSet):
         return self.post_serializer_class
 
     def get_queryset(self):
-        is_favorited = self.request.query_params.get('is_favorited')
-        is_in_shopping_cart = self.request.query_params.get(
-            'is_in_shopping_cart'
+        queryset = Recipes.objects.select_related('author').prefetch_related(
+            Prefetch('tags', queryset=Tags.objects.all()),
+            recipe_ingredients_prefetch(),
         )
-        tags = self.request.query_params.getlist('tags')
-        author = self.request.query_params.get('author')
-        queryset = Recipes.objects.all()
-        if author:
-            queryset = queryset.filter(author_id=author)
-        if is_favorited:
-            favorite_id = Favorite.objects.filter(
-                user=self.request.user).values_list('recipe', flat=True
-                                                    )
-            queryset = Recipes.objects.filter(id__in=favorite_id)
-        if is_in_shopping_cart:
-            shopping_cart = ShoppingCart.objects.filter(
-                user=self.request.user).values_list('recipe', flat=True
-                                                    )
-            queryset = queryset.filter(id__in=shopping_cart)
-        if tags:
-            queryset = queryset.filter(tags__slug__in=tags).distinct()
         return queryset
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        delete_recipe_ingredients(instance.id, instance.recipe_with_ing.all())
+        instance.delete()
+
+    def list(self, request, *args, **kwargs):
+        return cached_response(
+            self, request, 'recipes', (RECIPES, RECIPE_REFS),
+            lambda: super(RecipesViewSet, self).list(
+                request, *args, **kwargs
+            )
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs[self.lookup_field]
+        if not pk.isdigit():
+            # Not an id, answered with a 404 and not cached.
+            return super().retrieve(request, *args, **kwargs)
+        # By the id, not the URL text: /api/recipes/01/ shows recipe 1
+        # and has to follow its writes.
+        return cached_response(
+            self, request, 'recipe', (RECIPE.format(int(pk)), RECIPE_REFS),
+            lambda: super(RecipesViewSet, self).retrieve(
+                request, *args, **kwargs
+            )
+        )
+
+    @action(detail=False, url_path='what_can_i_cook')
+    def what_can_i_cook(self, request):
+        try:
+            ingredient_ids = {
+                int(ingredient_id)
+                for value in request.query_params.getlist('ingredients')
+                for ingredient_id in value.split(',') if ingredient_id
+            }
+        except ValueError:
+            return Response({
+                "message": "ingredients must be a list of ids"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        ranked = cook_index.rank(ingredient_ids)
+        # Ranked in memory, only the requested page is loaded.
+        paginator = CustomPagination()
+        page = paginator.paginate_queryset(ranked, request, view=self)
+        recipes = Recipes.objects.select_related('author').prefetch_related(
+            'tags', recipe_ingredients_prefetch()
+        ).in_bulk([recipe_id for recipe_id, _, _ in page])
+        results = []
+        for recipe_id, coverage, missing in page:
+            recipe = recipes.get(recipe_id)
+            if recipe is None:
+                continue
+            recipe.coverage = round(coverage, 4)
+            recipe.missing_ingredients = missing
+            results.append(recipe)
+        serializer = CookRecipesSerializer(
+            results, many=True, context=self.get_serializer_context()
+        )
+        return paginator.get_paginated_response(serializer.data)
+
 
 class FollowView(APIView):
+    query_budget = {'post': 7, 'delete': 5}
+
     def post(self, request, **kwargs):
 
         user = request.user
@@ -156,8 +232,9 @@ class FollowView(APIView):
         try:
             following = User.objects.get(pk=following_id)
             Follow.objects.create(user=user, following=following)
-            following.is_subscribed = True
-            serializer = UserFollowSerializer(following)
+            serializer = UserFollowSerializer(
+                following, context={'request': request}
+            )
             return Response(serializer.data)
         except User.DoesNotExist:
             return Response({
@@ -182,76 +259,144 @@ class FollowView(APIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class ShoppingCartView(APIView):
-    def post(self, request, **kwargs):
+class RecipeListView(APIView):
+    # Adds or removes one recipe on the user's favorites or shopping
+    # cart, both idempotent, see api/recipe_lists.py
+    query_budget = {'post': 7, 'delete': 6}
+    kind = None
 
-        user = request.user
-        recipe_id = kwargs['pk1']
-        recipe = Recipes.objects.get(pk=recipe_id)
-        recipe.is_in_shopping_cart = True
-        ShoppingCart.objects.create(
-            user=user, recipe=recipe
-        )
+    def post(self, request, **kwargs):
+        recipe = get_object_or_404(Recipes, pk=kwargs['pk1'])
+        add_recipes(request.user.id, self.kind, [recipe.id])
         serializer = ShoppingCartSerializer(recipe)
         return Response(serializer.data)
 
     def delete(self, request, *args, **kwargs):
+        remove_recipes(request.user.id, self.kind, [kwargs['pk1']])
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
-        user = request.user
-        recipe_id = kwargs['pk1']
-        shopping_obj = ShoppingCart.objects.filter(
-            recipe_id=recipe_id, user=user
+
+class RecipeListBulkView(APIView):
+    # The same for many recipes at once: {"recipes": [1, 2, 3]}
+    query_budget = 7
+    kind = None
+
+    def get_recipes(self, request):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data['recipes']
+
+    def post(self, request):
+        recipes = self.get_recipes(request)
+        add_recipes(
+            request.user.id, self.kind, [recipe.id for recipe in recipes]
+        )
+        serializer = ShoppingCartSerializer(recipes, many=True)
+        return Response(serializer.data)
+
+    def delete(self, request):
+        recipes = self.get_recipes(request)
+        remove_recipes(
+            request.user.id, self.kind, [recipe.id for recipe in recipes]
         )
-        shopping_obj.delete()
-        shopping_obj.is_in_shopping_cart = False
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+class ShoppingCartView(RecipeListView):
+    kind = 'cart'
+
+
+class ShoppingCartBulkView(RecipeListBulkView):
+    kind = 'cart'
+
+
 class AllFollowingView(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserFollowSerializer
     permission_classes = (permissions.AllowAny,)
     pagination_class = CustomSubscriptionsPagination
+    query_budget = 5
+    replica_reads = True
 
     def get_queryset(self):
-        request_user_id = self.request.user
-        following_ids = User.objects.filter(following__user=request_user_id)
-        return following_ids
+        user = self.request.user
+        if not user.is_authenticated:
+            return User.objects.none()
+        return User.objects.filter(following__user=user).order_by('id')
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        return self.prefetch_latest_recipes(page)
+
+    def prefetch_latest_recipes(self, page):
+        if page:
+            prefetch_related_objects(page, Prefetch(
+                'recipes_set',
+                queryset=latest_recipes(
+                    [author.id for author in page],
+                    get_recipes_limit(self.request)
+                ),
+                to_attr='latest_recipes'
+            ))
+        return page
+
+
+class ResponseCacheStatsView(APIView):
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request):
+        return Response(response_cache_stats())
+
+
+class DBPoolStatsView(APIView):
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request):
+        return Response(pool_stats())
 
 
 class DownloadShoppingCartView(APIView):
+    # The file is streamed after the view returns, its queries are not
+    # counted here.
+    query_budget = 3
+
+    def perform_content_negotiation(self, request, force=False):
+        # ?format= selects the file format here, not a DRF renderer.
+        return super().perform_content_negotiation(request, force=True)
+
     def get(self, request):
+        file_format = request.query_params.get('format', 'txt').lower()
+        if file_format not in SHOPPING_LIST_FORMATS:
+            return Response({
+                "message": "Unsupported format, use one of: "
+                           + ", ".join(SHOPPING_LIST_FORMATS)
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if request.query_params.get('async'):
+            # Rendered by a worker into the cache, the download itself
+            # is then served from there.
+            job = enqueue(
+                'render_shopping_cart',
+                {'user_id': request.user.id, 'file_format': file_format},
+                user=request.user
+            )
+            return Response(
+                JobSerializer(job).data, status=status.HTTP_202_ACCEPTED
+            )
         shopping_ids = ShoppingCart.objects.filter(
             user_id=self.request.user.id).values_list('recipe', flat=True
                                                       )
         # run dedicated function
-        return download_shopping_cart(shopping_ids)
+        return download_shopping_cart(
+            request.user.id, shopping_ids, file_format
+        )
 
 
-class FavoriteView(APIView):
-    filter_backends = (DjangoFilterBackend,)
-    filterset_fields = ('tags',)
+class FavoriteView(RecipeListView):
+    kind = 'favorites'
 
-    def post(self, request, **kwargs):
 
-        user = request.user
-        recipe_id = kwargs['pk1']
-        recipe = Recipes.objects.get(pk=recipe_id)
-        recipe.is_favorited = True
-        recipe.save()
-        Favorite.objects.create(user=user, recipe=recipe)
-        serializer = ShoppingCartSerializer(recipe)
-        return Response(serializer.data)
-
-    def delete(self, request, *args, **kwargs):
-        user = request.user
-        recipe_id = kwargs['pk1']
-        favorite_recipe = Favorite.objects.filter(
-            recipe_id=recipe_id, user=user
-        )
-        favorite_recipe.delete()
-        favorite_recipe.is_favorited = False
-        return Response(status=status.HTTP_204_NO_CONTENT)
+class FavoriteBulkView(RecipeListBulkView):
+    kind = 'favorites'
 
 
 class IngredientsViewSet(viewsets.ModelViewSet):
@@ -261,6 +406,28 @@ class IngredientsViewSet(viewsets.ModelViewSet):
     pagination_class = None
     filter_backends = (DjangoFilterBackend, )
     filterset_class = IngredientsFilter
+    query_budget = 3
+    replica_reads = True
+
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name:
+            # Autocomplete is answered from the in-process index.
+            return Response(ingredients_index.search(name))
+        return snapshot_response(
+            request, snapshots.get('ingredients', self.serialize_all)
+        )
+
+    def serialize_all(self):
+        return self.get_serializer(self.get_queryset(), many=True).data
+
+
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    query_budget = 3
+    serializer_class = JobSerializer
+
+    def get_queryset(self):
+        return Job.objects.filter(user=self.request.user).order_by('-id')
 
 
 class TagViewSet(
@@ -270,3 +437,13 @@ class TagViewSet(
     queryset = Tags.objects.all()
     serializer_class = TagSerializer
     permission_classes = (permissions.AllowAny,)
+    query_budget = 3
+    replica_reads = True
+
+    def list(self, request, *args, **kwargs):
+        return snapshot_response(
+            request, snapshots.get('tags', self.serialize_all)
+        )
+
+    def serialize_all(self):
+        return self.get_serializer(self.get_queryset(), many=True).data
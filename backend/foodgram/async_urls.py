@@ -0,0 +1,9 @@
+from django.urls import include, path
+
+from .urls import urlpatterns as sync_urlpatterns
+
+# ROOT_URLCONF with ASYNC_VIEWS, for serving through foodgram/asgi.py
+urlpatterns = [
+    path('api/', include('api.async_urls')),
+    *sync_urlpatterns,
+]
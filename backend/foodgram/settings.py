@@ -47,6 +47,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.instrumentation.SQLInstrumentationMiddleware',
+    'api.db_router.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -58,7 +60,16 @@ MIDDLEWARE = [
 
 AUTH_USER_MODEL = 'users.User'
 
-ROOT_URLCONF = 'foodgram.urls'
+# Under an ASGI server the read endpoints can be served by async views,
+# see api/async_views.py. Their independent queries run at the same
+# time on separate connections unless ASYNC_CONCURRENT_QUERIES is off.
+
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'False') == 'True'
+ASYNC_CONCURRENT_QUERIES = os.getenv(
+    'ASYNC_CONCURRENT_QUERIES', 'True'
+) == 'True'
+
+ROOT_URLCONF = 'foodgram.async_urls' if ASYNC_VIEWS else 'foodgram.urls'
 
 TEMPLATES = [
     {
@@ -82,17 +93,128 @@ WSGI_APPLICATION = 'foodgram.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+# api.db_backend is PostgreSQL with connection reuse counters, see
+# api/db_pool.py. Connections are kept for DB_CONN_MAX_AGE seconds and
+# checked before reuse; behind PgBouncer in transaction mode set
+# DB_PGBOUNCER, server-side cursors do not survive its pooling.
+
 DATABASES = {
     'default': {
-        'ENGINE': os.getenv('DB_ENGINE', 'django.db.backends.postgresql'),
+        'ENGINE': os.getenv('DB_ENGINE', 'api.db_backend'),
         'NAME': os.getenv('DB_NAME', 'postgres'),
         'USER': os.getenv('POSTGRES_USER', 'postgres'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', 'postgres'),
         'HOST': os.getenv('DB_HOST', 'localhost'),
-        'PORT': os.getenv('DB_PORT', '5432')
+        'PORT': os.getenv('DB_PORT', '5432'),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': os.getenv(
+            'DB_CONN_HEALTH_CHECKS', 'True'
+        ) == 'True',
+        'DISABLE_SERVER_SIDE_CURSORS': os.getenv(
+            'DB_PGBOUNCER', 'False'
+        ) == 'True',
+    }
+}
+
+# Read replicas, see api/db_router.py. DB_REPLICA_HOSTS is a comma
+# separated list of host[:port] sharing the primary's database name and
+# credentials. Views with replica_reads send their safe requests there,
+# except for a client that wrote in the last DB_PRIMARY_STICKY_SECONDS.
+
+DATABASE_REPLICAS = []
+for number, address in enumerate(
+    filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), 1
+):
+    host, _, port = address.strip().partition(':')
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+
+DATABASE_ROUTERS = ['api.db_router.ReplicaRouter']
+
+DB_PRIMARY_STICKY_SECONDS = int(os.getenv('DB_PRIMARY_STICKY_SECONDS', 5))
+
+# The web processes and run_workers must share one cache, e.g. Redis as
+# in infra/docker-compose.yml: versions, locks and the files workers
+# render all live there. LocMemCache only suits a single process.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
     }
 }
 
+# Rendered shopping lists are cached per cart version, see
+# api/download_shopping_cart.py
+
+SHOPPING_LIST_CACHE_TIMEOUT = int(
+    os.getenv('SHOPPING_LIST_CACHE_TIMEOUT', 60 * 60 * 24)
+)
+
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+# Results returned by the ingredient autocomplete, see
+# api/ingredients_index.py
+
+INGREDIENTS_SEARCH_LIMIT = int(os.getenv('INGREDIENTS_SEARCH_LIMIT', 20))
+
+# Limits for base64 images sent to the API, see api/images.py
+
+IMAGE_UPLOAD_MAX_BYTES = int(
+    os.getenv('IMAGE_UPLOAD_MAX_BYTES', 10 * 1024 * 1024)
+)
+
+IMAGE_UPLOAD_MAX_PIXELS = int(os.getenv('IMAGE_UPLOAD_MAX_PIXELS', 25000000))
+
+IMAGE_UPLOAD_SPOOL_SIZE = int(
+    os.getenv('IMAGE_UPLOAD_SPOOL_SIZE', 1024 * 1024)
+)
+
+# Text search configuration for ?search= on PostgreSQL, see
+# recipe/search.py
+
+RECIPE_SEARCH_CONFIG = os.getenv('RECIPE_SEARCH_CONFIG', 'russian')
+
+# Per-user favorite, cart and follow id sets, see api/memberships.py
+
+MEMBERSHIP_CACHE_TIMEOUT = int(
+    os.getenv('MEMBERSHIP_CACHE_TIMEOUT', 60 * 60)
+)
+
+# Anonymous recipe list and detail responses, see api/response_cache.py
+
+RESPONSE_CACHE_TIMEOUT = int(
+    os.getenv('RESPONSE_CACHE_TIMEOUT', 60 * 60)
+)
+
+# Background jobs, see api/jobs.py and the run_workers command
+
+JOB_WORKER_THREADS = int(os.getenv('JOB_WORKER_THREADS', 2))
+JOB_WORKER_PROCESSES = int(os.getenv('JOB_WORKER_PROCESSES', 1))
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 1))
+JOB_RETRY_DELAY = int(os.getenv('JOB_RETRY_DELAY', 10))
+JOB_MAX_RETRY_DELAY = int(os.getenv('JOB_MAX_RETRY_DELAY', 60 * 60))
+JOB_TIMEOUT = int(os.getenv('JOB_TIMEOUT', 60 * 60))
+JOB_RETENTION_DAYS = int(os.getenv('JOB_RETENTION_DAYS', 7))
+
+# Per-request query counts and Server-Timing, see api/instrumentation.py
+
+SQL_INSTRUMENTATION = os.getenv('SQL_INSTRUMENTATION', 'True') == 'True'
+SQL_STRICT_BUDGETS = os.getenv('SQL_STRICT_BUDGETS', 'False') == 'True'
+SQL_DUPLICATE_THRESHOLD = int(os.getenv('SQL_DUPLICATE_THRESHOLD', 5))
+SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS', 500))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from recipe.models import (Favorite, Ingredients, RecipeIngredients, Recipes,
                            ShoppingCart, Tags)
-from django.core.management import call_command
+from api.jobs import enqueue
 
 
 class RecipeIngredientsInLine(admin.TabularInline):
@@ -35,8 +35,10 @@ class IngredientsAdm(admin.ModelAdmin):
     list_filter = ['name']
 
     def fill_the_base(self, request, queryset):
-        for qs in queryset:
-            call_command('fill_the_base')
+        # The selection does not matter, the file is imported once by
+        # a worker, see the run_workers command.
+        job = enqueue('fill_the_base', user=request.user)
+        self.message_user(request, f'Import queued as job {job.id}')
 
 
 class RecipesAdm(admin.ModelAdmin):
@@ -50,7 +52,8 @@ class RecipesAdm(admin.ModelAdmin):
         'cooking_time',
         'author',
         'ingredient',
-        'favorite_count'
+        'favorites_count',
+        'shopping_cart_count',
     )
     list_display_links = ('name',)
     list_filter = ['author', 'name', 'tags']
@@ -62,9 +65,6 @@ class RecipesAdm(admin.ModelAdmin):
     def tag(self, obj):
         return ", ".join([tag.name for tag in obj.tags.all()])
 
-    def favorite_count(self, obj):
-        return Favorite.objects.filter(recipe=obj).count()
-
 
 admin.site.register(Tags, TagsAdm)
 admin.site.register(Recipes, RecipesAdm)
@@ -1,7 +1,9 @@
 from colorfield.fields import ColorField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
 from django.db import models
-from users.models import User
+from users.models import CounterFieldsMixin, User
 
 
 class Ingredients(models.Model):
@@ -16,6 +18,19 @@ class Ingredients(models.Model):
     class Meta:
         verbose_name = 'Ingredient'
         verbose_name_plural = 'Ingredients'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_ingredient'
+            ),
+        )
+        indexes = [
+            # LIKE 'prefix%' on PostgreSQL with a non-C collation.
+            models.Index(
+                fields=['name'], name='ingredient_name_prefix_idx',
+                opclasses=['varchar_pattern_ops']
+            ),
+        ]
 
 
 class Tags(models.Model):
@@ -31,7 +46,7 @@ class Tags(models.Model):
         verbose_name_plural = 'Tags'
 
 
-class Recipes(models.Model):
+class Recipes(CounterFieldsMixin, models.Model):
     name = models.CharField(max_length=200, verbose_name='Recipe_name')
     image = models.ImageField(
         upload_to='recipes/images',
@@ -64,6 +79,21 @@ class Recipes(models.Model):
         auto_now_add=True,
         verbose_name='Publication_date'
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Times_added_to_favorites'
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Times_added_to_shopping_cart'
+    )
+
+    # Full-text index over name and text, see recipe/search.py
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    counter_fields = ('favorites_count', 'shopping_cart_count')
 
     def __str__(self):
         return self.name
@@ -72,6 +102,21 @@ class Recipes(models.Model):
         verbose_name = 'Recipe'
         verbose_name_plural = 'Recipes'
         ordering = ['-pub_date']
+        indexes = [
+            GinIndex(fields=['search_vector'], name='recipe_search_gin'),
+            models.Index(
+                fields=['cooking_time'], name='recipe_cooking_time_idx'
+            ),
+            # The feed and the author feed, in the order of
+            # api/pagination.py and api/subscriptions.py.
+            models.Index(
+                fields=['-pub_date', '-id'], name='recipe_feed_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_feed_idx'
+            ),
+        ]
 
 
 class RecipeIngredients(models.Model):
@@ -0,0 +1,132 @@
+import re
+
+from django.conf import settings
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import F, FloatField
+from django.db.models.expressions import RawSQL
+
+from recipe.models import Recipes
+
+# SQLite has no tsvector, there the search index is an FTS5 table kept
+# next to recipe_recipes.
+SQLITE_SEARCH_TABLE = 'recipe_search'
+WORD = re.compile(r'\w+')
+
+
+def is_postgresql():
+    return connection.vendor == 'postgresql'
+
+
+def recipe_search_vector():
+    config = settings.RECIPE_SEARCH_CONFIG
+    return (
+        SearchVector('name', weight='A', config=config)
+        + SearchVector('text', weight='B', config=config)
+    )
+
+
+def create_search_index(using=DEFAULT_DB_ALIAS, **kwargs):
+    # post_migrate handler: creates the FTS5 table on SQLite and fills
+    # the index for rows that do not have it yet.
+    vendor = connections[using].vendor
+    if vendor == 'postgresql':
+        Recipes.objects.using(using).filter(search_vector=None).update(
+            search_vector=recipe_search_vector()
+        )
+        return
+    if vendor != 'sqlite':
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+            (SQLITE_SEARCH_TABLE,)
+        )
+        if cursor.fetchone():
+            return
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE {SQLITE_SEARCH_TABLE} '
+            f'USING fts5(name, text)'
+        )
+        cursor.execute(
+            f'INSERT INTO {SQLITE_SEARCH_TABLE} (rowid, name, text) '
+            f'SELECT id, name, text FROM {Recipes._meta.db_table}'
+        )
+
+
+def rebuild_search_index(using=DEFAULT_DB_ALIAS):
+    # For recipes written without signals, e.g. by bulk_create.
+    vendor = connections[using].vendor
+    if vendor == 'postgresql':
+        Recipes.objects.using(using).update(
+            search_vector=recipe_search_vector()
+        )
+    elif vendor == 'sqlite':
+        create_search_index(using)
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SQLITE_SEARCH_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {SQLITE_SEARCH_TABLE} (rowid, name, text) '
+                f'SELECT id, name, text FROM {Recipes._meta.db_table}'
+            )
+
+
+def update_search_index(recipe):
+    if is_postgresql():
+        Recipes.objects.filter(pk=recipe.pk).update(
+            search_vector=recipe_search_vector()
+        )
+    elif connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {SQLITE_SEARCH_TABLE} WHERE rowid = %s',
+                (recipe.pk,)
+            )
+            cursor.execute(
+                f'INSERT INTO {SQLITE_SEARCH_TABLE} (rowid, name, text) '
+                f'VALUES (%s, %s, %s)',
+                (recipe.pk, recipe.name, recipe.text)
+            )
+
+
+def delete_from_search_index(recipe):
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {SQLITE_SEARCH_TABLE} WHERE rowid = %s',
+                (recipe.pk,)
+            )
+
+
+def search_recipes(queryset, text):
+    # Adds the full-text condition and relevance ordering to an already
+    # filtered queryset, so search and filters run as one query.
+    if is_postgresql():
+        query = SearchQuery(
+            text,
+            config=settings.RECIPE_SEARCH_CONFIG,
+            search_type='websearch'
+        )
+        return queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by('-rank', '-pub_date', '-id')
+    words = WORD.findall(text)
+    if not words:
+        return queryset.none()
+    # Every word as a quoted prefix term, FTS5 operators in the input
+    # are never interpreted.
+    match = ' '.join(f'"{word}"*' for word in words)
+    # bm25() is lower for better matches, name weighs twice the text
+    # like weights A and B on PostgreSQL.
+    rank = RawSQL(
+        f'SELECT bm25({SQLITE_SEARCH_TABLE}, 2.0, 1.0) '
+        f'FROM {SQLITE_SEARCH_TABLE} '
+        f'WHERE {SQLITE_SEARCH_TABLE} MATCH %s '
+        f'AND rowid = {Recipes._meta.db_table}.id',
+        (match,),
+        output_field=FloatField()
+    )
+    return queryset.annotate(rank=rank).filter(
+        rank__isnull=False
+    ).order_by('rank', '-pub_date', '-id')
@@ -0,0 +1,71 @@
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipe.models import Favorite, Recipes, ShoppingCart
+from recipe.search import delete_from_search_index, update_search_index
+from users.models import Follow, User
+
+
+def change_counter(model, pk, field, delta):
+    # Runs in the transaction of the write that triggered it.
+    model.objects.filter(pk=pk).update(
+        **{field: Greatest(F(field) + delta, 0)}
+    )
+
+
+def counted(model, field, owner_field, target):
+    @receiver(post_save, sender=model, weak=False)
+    def created(sender, instance, created, **kwargs):
+        if created:
+            change_counter(target, getattr(instance, owner_field), field, 1)
+
+    @receiver(post_delete, sender=model, weak=False)
+    def deleted(sender, instance, **kwargs):
+        change_counter(target, getattr(instance, owner_field), field, -1)
+
+
+# (counted model, counter field, foreign key to the owner, owner model),
+# also used by the recount command.
+COUNTERS = (
+    (Favorite, 'favorites_count', 'recipe_id', Recipes),
+    (ShoppingCart, 'shopping_cart_count', 'recipe_id', Recipes),
+    (Recipes, 'recipes_count', 'author_id', User),
+    (Follow, 'followers_count', 'following_id', User),
+)
+
+for counter in COUNTERS:
+    counted(*counter)
+
+
+def actual_count(model, owner_field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{owner_field: OuterRef('pk')})
+            .order_by()
+            .values(owner_field)
+            .annotate(total=Count('pk'))
+            .values('total'),
+            output_field=IntegerField()
+        ),
+        0
+    )
+
+
+def recount(model, field, owner_field, owner, owner_ids):
+    # For writes that skip the signals: one UPDATE that recomputes the
+    # counters of the touched owners from the table itself.
+    owner.objects.filter(pk__in=owner_ids).update(
+        **{field: actual_count(model, owner_field)}
+    )
+
+
+@receiver(post_save, sender=Recipes)
+def recipe_saved(sender, instance, **kwargs):
+    update_search_index(instance)
+
+
+@receiver(post_delete, sender=Recipes)
+def recipe_deleted(sender, instance, **kwargs):
+    delete_from_search_index(instance)
@@ -1 +1,90 @@
-# Create your tests here.
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from recipe.models import Favorite, Recipes, ShoppingCart
+from users.models import Follow, User
+
+
+class CountersTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email='author@example.com', password='pass1234', username='author'
+        )
+        cls.reader = User.objects.create_user(
+            email='reader@example.com', password='pass1234', username='reader'
+        )
+
+    def create_recipe(self):
+        return Recipes.objects.create(
+            author=self.author, name='recipe', text='text', cooking_time=5
+        )
+
+    def test_counters_follow_creates_and_deletes(self):
+        recipe = self.create_recipe()
+        favorite = Favorite.objects.create(user=self.reader, recipe=recipe)
+        ShoppingCart.objects.create(user=self.reader, recipe=recipe)
+        ShoppingCart.objects.create(user=self.author, recipe=recipe)
+        Follow.objects.create(user=self.reader, following=self.author)
+        recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertEqual(recipe.shopping_cart_count, 2)
+        self.assertEqual(self.author.recipes_count, 1)
+        self.assertEqual(self.author.followers_count, 1)
+
+        favorite.delete()
+        ShoppingCart.objects.filter(recipe=recipe).delete()
+        Follow.objects.all().delete()
+        recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 0)
+        self.assertEqual(recipe.shopping_cart_count, 0)
+        self.assertEqual(self.author.followers_count, 0)
+
+        recipe.delete()
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 0)
+
+    def test_full_save_keeps_counters(self):
+        recipe = self.create_recipe()
+        Favorite.objects.create(user=self.reader, recipe=recipe)
+        recipe.name = 'renamed'
+        recipe.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, 'renamed')
+        self.assertEqual(recipe.favorites_count, 1)
+
+    def test_recount_repairs_drift(self):
+        recipe = self.create_recipe()
+        Favorite.objects.create(user=self.reader, recipe=recipe)
+        Recipes.objects.update(favorites_count=7)
+        User.objects.update(recipes_count=0)
+        out = StringIO()
+        call_command('recount', stdout=out)
+        recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertEqual(self.author.recipes_count, 1)
+        self.assertIn(
+            'Recipes.favorites_count: 1 rows repaired', out.getvalue()
+        )
+
+    def test_recount_writes_only_drifted_rows(self):
+        drifted, correct = self.create_recipe(), self.create_recipe()
+        Recipes.objects.filter(pk=drifted.pk).update(favorites_count=3)
+        with CaptureQueriesContext(connection) as queries:
+            call_command('recount', stdout=StringIO())
+        updates = [
+            query['sql'] for query in queries
+            if query['sql'].startswith('UPDATE')
+        ]
+        self.assertEqual(len(updates), 1)
+        self.assertIn(f'IN ({drifted.pk})', updates[0])
+        correct.refresh_from_db()
+        self.assertEqual(correct.favorites_count, 0)
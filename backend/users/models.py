@@ -34,7 +34,23 @@ class CustomUserManager(BaseUserManager):
         return self._create_user(email, password, **extra_fields)
 
 
-class User(AbstractBaseUser, PermissionsMixin):
+class CounterFieldsMixin:
+    # For models with counter_fields maintained by F() updates, see
+    # recipe/signals.py: a full save must not write back the values
+    # loaded earlier.
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class User(CounterFieldsMixin, AbstractBaseUser, PermissionsMixin):
 
     username = models.CharField("Ваш логин", unique=True, max_length=254)
     email = models.EmailField(
@@ -49,12 +65,16 @@ class User(AbstractBaseUser, PermissionsMixin):
     is_staff = models.BooleanField(default=True)
     is_active = models.BooleanField(default=True)
     is_superuser = models.BooleanField(default=False)
+    recipes_count = models.PositiveIntegerField(default=0, editable=False)
+    followers_count = models.PositiveIntegerField(default=0, editable=False)
 
     objects = CustomUserManager()
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = []
 
+    counter_fields = ('recipes_count', 'followers_count')
+
     class Meta:
         verbose_name = 'User'
         verbose_name_plural = 'Users'
@@ -74,6 +94,13 @@ class Follow(models.Model):
 
     class Meta:
         unique_together = ('user', 'following')
+        indexes = [
+            # Followers of a user, the unique index only serves lookups
+            # by follower.
+            models.Index(
+                fields=['following', 'user'], name='follow_following_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.user} {self.following}'